@@ -0,0 +1,237 @@
+from settings import *
+from linear_tree import LinearQuadTree, expand_ranges
+
+
+OPENING_CRITERIA = ("geometric", "offset", "relative")
+
+
+class BarnesHutForces:
+    """
+    Batched barnes-hut force evaluation over a LinearQuadTree.
+    The tree is walked for a whole batch of particles at once, one level per step, producing CSR-style interaction
+    lists. Every acceleration is then evaluated in one vectorized kernel, whose per-pair arrays are scratch buffers
+    kept between calls that only grow. The tree walk still allocates its per-level arrays and the interaction lists
+    on every call.
+    theta and opening can be changed between calls.
+    Args:
+        chunk_size (int): Max particles walked at once. Bounds the size of the interaction lists.
+        theta (float): Opening angle.
+        opening (str): Opening criterion, one of OPENING_CRITERIA (see far()).
+    """
+    def __init__(self, chunk_size: int = 4096, theta: float = BH_THETA, opening: str = BH_OPENING) -> None:
+        if opening not in OPENING_CRITERIA:
+            raise ValueError(f"unknown opening criterion {opening!r}, expected one of {OPENING_CRITERIA}")
+        self.chunk_size = chunk_size
+        self.theta = theta
+        self.opening = opening
+        self._scratch: dict[str, np.ndarray] = {}
+
+    def buffer(self, name: str, size: int, dtype=np.float64) -> np.ndarray:
+        """
+        Returns a scratch array of at least `size` elements, reallocating it (geometrically) only when too small.
+        Args:
+            name (str): Name of the buffer.
+            size (int): Number of elements needed.
+            dtype: Element type.
+        Returns:
+            np.ndarray: A view of exactly `size` elements.
+        """
+        buf = self._scratch.get(name)
+        if buf is None or buf.size < size or buf.dtype != dtype:
+            buf = np.empty(max(size, 2 * (buf.size if buf is not None else 0), 1024), dtype=dtype)
+            self._scratch[name] = buf
+        return buf[:size]
+
+    def far(self, tree: LinearQuadTree, node: np.ndarray, d2: np.ndarray, acc: np.ndarray) -> np.ndarray:
+        """
+        Tests which nodes are far enough from their particles to be used whole, by the opening criterion:
+            - geometric: s / d < theta, s being the node size and d the distance to its center of mass.
+            - offset: d > s / theta + the distance between the node's center of mass and its center (Barnes 1994),
+              so lopsided nodes are opened sooner.
+            - relative: (G * M / d^2) * (s / d)^2 < theta^2 * |a| and s < d (Springel 2005): the geometric test
+              scaled by the node's share of the particle's last acceleration, so nodes that barely pull on a particle
+              are used whole further in. Particles with no last acceleration fall back to the geometric test.
+        Args:
+            tree (LinearQuadTree): A built tree.
+            node (np.ndarray): Node of every test.
+            d2 (np.ndarray): Squared distance of every test's particle to the node's center of mass.
+            acc (np.ndarray): Magnitude of the last acceleration of every test's particle.
+        Returns:
+            np.ndarray: Boolean mask of the nodes that are used whole.
+        """
+        s2 = tree.s2[node]
+        theta2 = self.theta * self.theta
+        if self.opening == "offset":
+            reach = np.sqrt(s2) / self.theta + tree.com_offset[node]
+            return reach * reach < d2
+        geometric = s2 < theta2 * d2
+        if self.opening == "relative":
+            relative = (s2 < d2) & (G * tree.mass[node] * s2 < theta2 * acc * d2 * d2)
+            return np.where(acc > 0, relative, geometric)
+        return geometric
+
+    def interaction_lists(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray,
+                          acc: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Walks the tree for every particle at once, opening nodes by the opening criterion.
+        A leaf too close to be used whole is replaced by every particle in it.
+        Args:
+            tree (LinearQuadTree): A built tree.
+            x, y (np.ndarray): Positions of the particles.
+            acc (np.ndarray | None): Magnitude of every particle's last acceleration, for the "relative" criterion.
+        Returns:
+            tuple:
+                - offsets (np.ndarray): Particle i interacts with sources[offsets[i]:offsets[i + 1]].
+                - sources (np.ndarray): Indices into the tree's source table (node centers of mass, then particles).
+        """
+        epsilon = 1e-5
+        n = len(x)
+        if tree.n_nodes == 0 or n == 0:
+            return np.zeros(n + 1, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if acc is None:
+            acc = np.zeros(n)
+
+        owners, sources = [], []
+        p = np.arange(n)
+        node = np.zeros(n, dtype=np.int64)
+        while p.size:
+            dx = tree.x_com[node] - x[p]
+            dy = tree.y_com[node] - y[p]
+            d2 = np.maximum(dx*dx + dy*dy, epsilon) # avoid division by zero
+            far = self.far(tree, node, d2, acc[p])
+            accept = far & (tree.mass[node] != 0)
+            owners.append(p[accept])
+            sources.append(node[accept])
+
+            leaf = ~far & (tree.first_child[node] < 0)
+            counts = tree.count[node[leaf]]
+            owners.append(np.repeat(p[leaf], counts))
+            sources.append(tree.n_nodes + expand_ranges(tree.start[node[leaf]], counts))
+
+            opened = ~far & ~leaf
+            p, node = p[opened], node[opened]
+            n_children = tree.n_children[node]
+            p = np.repeat(p, n_children)
+            node = expand_ranges(tree.first_child[node], n_children)
+
+        owners = np.concatenate(owners)
+        sources = np.concatenate(sources)
+        order = np.argsort(owners, kind="stable")
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners, minlength=n), out=offsets[1:])
+        return offsets, sources[order]
+
+    def evaluate(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray, offsets: np.ndarray, sources: np.ndarray, out: np.ndarray) -> None:
+        """
+        Sums the accelerations that the interaction lists exert on every particle.
+        Args:
+            tree (LinearQuadTree): The tree the interaction lists index into.
+            x, y (np.ndarray): Positions of the particles.
+            offsets, sources (np.ndarray): Interaction lists from interaction_lists().
+            out (np.ndarray): (n, 2) array the accelerations are written to.
+        """
+        n = len(x)
+        k = len(sources)
+        # owner of every pair: count the particles whose list starts at or before it
+        owner = self.buffer("owner", k, np.int64)
+        owner[:] = 0
+        starts = offsets[1:-1]
+        np.add.at(owner, starts[starts < k], 1)
+        np.cumsum(owner, out=owner)
+        dx = self.buffer("dx", k)
+        dy = self.buffer("dy", k)
+        w = self.buffer("w", k)
+        tmp = self.buffer("tmp", k)
+
+        np.take(tree.source_x, sources, out=dx)
+        np.subtract(dx, np.take(x, owner, out=tmp), out=dx)
+        np.take(tree.source_y, sources, out=dy)
+        np.subtract(dy, np.take(y, owner, out=tmp), out=dy)
+
+        # w = G * m / (d2 + epsilon)**1.5
+        np.multiply(dx, dx, out=w)
+        np.multiply(dy, dy, out=tmp)
+        w += tmp
+        w += GRAVITY_SOFTENING
+        np.power(w, 1.5, out=w)
+        np.divide(np.take(tree.source_m, sources, out=tmp), w, out=w)
+        w *= G
+
+        dx *= w
+        dy *= w
+        out[:, 0] = np.bincount(owner, weights=dx, minlength=n)
+        out[:, 1] = np.bincount(owner, weights=dy, minlength=n)
+
+    def accelerations(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray, previous: np.ndarray | None = None) -> np.ndarray:
+        """
+        Calculates the barnes-hut acceleration of every particle.
+        Args:
+            tree (LinearQuadTree): A built tree.
+            x, y (np.ndarray): Positions of the particles.
+            previous (np.ndarray | None): (n, 2) last accelerations of the particles, used by the "relative" criterion.
+        Returns:
+            np.ndarray: (n, 2) accelerations.
+        """
+        n = len(x)
+        acc = np.zeros((n, 2))
+        magnitude = np.hypot(previous[:, 0], previous[:, 1]) if previous is not None else None
+        for start in range(0, n, self.chunk_size):
+            chunk = slice(start, min(start + self.chunk_size, n))
+            offsets, sources = self.interaction_lists(tree, x[chunk], y[chunk], magnitude[chunk] if magnitude is not None else None)
+            self.evaluate(tree, x[chunk], y[chunk], offsets, sources, acc[chunk])
+        return acc
+
+    def potentials(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Calculates the barnes-hut gravitational potential at every position, from the same interaction lists as
+        accelerations().
+        Args:
+            tree (LinearQuadTree): A built tree.
+            x, y (np.ndarray): Positions to evaluate.
+        Returns:
+            np.ndarray: (n,) potentials (energy per unit mass).
+        """
+        n = len(x)
+        phi = np.zeros(n)
+        for start in range(0, n, self.chunk_size):
+            chunk = slice(start, min(start + self.chunk_size, n))
+            offsets, sources = self.interaction_lists(tree, x[chunk], y[chunk])
+            owner = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+            dx = tree.source_x[sources] - x[chunk][owner]
+            dy = tree.source_y[sources] - y[chunk][owner]
+            weights = tree.source_m[sources] / np.sqrt(dx*dx + dy*dy + GRAVITY_SOFTENING)
+            phi[chunk] = -G * np.bincount(owner, weights=weights, minlength=len(offsets) - 1)
+        return phi
+
+
+if __name__ == '__main__':
+    # before/after timing of the per-particle query_bh + apply_forces path against the batched kernel
+    import time
+    from utils import QuadTree, build_quadtree, apply_forces
+    from store import ParticleStore
+
+    rng = np.random.default_rng(0)
+    world_rect = pygame.FRect(-HALF_WORLD_WIDTH, -HALF_WORLD_HEIGHT, HALF_WORLD_WIDTH * 2, HALF_WORLD_HEIGHT * 2)
+    for n in (1000, NUM_PARTICLES, 10000):
+        store = ParticleStore(n)
+        for _ in range(n):
+            store.add(rng.uniform(-HALF_WORLD_WIDTH, HALF_WORLD_WIDTH), rng.uniform(-HALF_WORLD_HEIGHT, HALF_WORLD_HEIGHT),
+                      0, 0, rng.integers(1, MAX_STARTING_MASS), rng.integers(1, MAX_STARTING_DENSITY))
+        rows = np.arange(n)
+        quadtree, linear = QuadTree(world_rect, 1, None), LinearQuadTree(world_rect, 1)
+        build_quadtree(quadtree, store, rows)
+        build_quadtree(linear, store, rows)
+
+        start = time.perf_counter()
+        before = np.array([apply_forces(quadtree.query_bh(x, y), x, y) for x, y in store.pos.tolist()])
+        per_particle = time.perf_counter() - start
+
+        forces = BarnesHutForces()
+        forces.accelerations(linear, store.x, store.y) # warm up the scratch buffers
+        start = time.perf_counter()
+        after = forces.accelerations(linear, store.x, store.y)
+        batched = time.perf_counter() - start
+
+        error = np.abs(after - before).max() / np.abs(before).max()
+        print(f"n={n}: per-particle {per_particle*1e3:.1f} ms, batched {batched*1e3:.1f} ms "
+              f"({per_particle / batched:.1f}x), max relative difference {error:.1e}")
@@ -0,0 +1,229 @@
+"""
+Deterministic benchmark suite for the simulation hot paths.
+
+    python src/bench.py --output bench.json
+    python src/bench.py --output bench.json --baseline baseline.json
+
+Every phase is timed on seeded scenes of several sizes. With --baseline, phases whose median got slower than the
+baseline by more than --threshold are reported and the exit code is 1.
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") # draws go to an offscreen surface, no window needed
+import argparse
+import json
+import platform
+from settings import *
+from utils import *
+from cam import Cam
+from groups import ParticleDrawing
+from particle import Particle
+from simulation import Simulation
+from store import ParticleStore
+
+SIZES = [1000, NUM_PARTICLES, 10000, MAX_PARTICLES]
+WORLD_RECT = pygame.FRect(-HALF_WORLD_WIDTH, -HALF_WORLD_HEIGHT, HALF_WORLD_WIDTH * 2, HALF_WORLD_HEIGHT * 2)
+
+
+def make_scene(n: int, seed: int) -> ParticleStore:
+    """
+    Builds a seeded scene with the same ranges as Game.make_particles().
+    Args:
+        n (int): Number of particles.
+        seed (int): RNG seed.
+    Returns:
+        ParticleStore: The scene.
+    """
+    sim = Simulation()
+    sim.make_particles(n, np.random.default_rng(seed))
+    return sim.store
+
+def with_handles(store: ParticleStore) -> tuple[ParticleStore, ParticleDrawing]:
+    """
+    Copies a scene into a new store where every particle has a sprite handle, for the drawing phases.
+    Args:
+        store (ParticleStore): The scene.
+    Returns:
+        tuple: the new store, and the ParticleDrawing group holding its handles.
+    """
+    drawn = ParticleStore(len(store))
+    group = ParticleDrawing()
+    for (x, y), (vx, vy), mass, density in zip(store.pos.tolist(), store.vel.tolist(), store.mass.tolist(), store.density.tolist()):
+        Particle(x, y, vx, vy, mass, density, group, drawn)
+    return drawn, group
+
+def time_phase(setup, run, repeat: int) -> dict[str, float]:
+    """
+    Times a phase. setup() is called before every run and is not timed; its result is passed to run().
+    Args:
+        setup (Callable): Builds the phase's input.
+        run (Callable): The timed code.
+        repeat (int): Number of timed runs.
+    Returns:
+        dict: min and median run time in milliseconds.
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter_ns()
+        run(state)
+        times.append((time.perf_counter_ns() - start) / 1e6)
+    return {"min_ms": min(times), "median_ms": float(np.median(times))}
+
+def bench_size(n: int, seed: int, repeat: int, phases: set[str] | None, workers: int = 0) -> dict[str, dict[str, float]]:
+    """
+    Times every phase on one scene size.
+    Args:
+        n (int): Number of particles.
+        seed (int): RNG seed for the scene.
+        repeat (int): Number of timed runs per phase.
+        phases (set[str] | None): Phases to run. All of them if None.
+        workers (int): Worker processes for the parallel_forces phase, which is skipped if <= 1.
+    Returns:
+        dict: phase name -> timings.
+    """
+    store = make_scene(n, seed)
+    rows = np.arange(n)
+    quadtree = QuadTree(WORLD_RECT, 1, None)
+    build_quadtree(quadtree, store, rows)
+    linear = LinearQuadTree(WORLD_RECT, 1)
+    build_quadtree(linear, store, rows)
+    forces = BarnesHutForces()
+    fmm = FMMForces()
+    mesh = ParticleMeshForces()
+    direct = DirectForces()
+
+    def grid_for(scene):
+        grid = SpatialGrid()
+        for i, x, y in zip(rows.tolist(), scene.x.tolist(), scene.y.tolist()):
+            grid.add_particle(i, x, y)
+        return scene, grid
+
+    def query_per_particle(_):
+        for x, y in store.pos.tolist():
+            apply_forces(quadtree.query_bh(x, y), x, y)
+
+    def refit_setup():
+        tree = QuadTree(WORLD_RECT, 1, None)
+        tree.refit(rows.tolist(), store.ids.tolist(), store.x.tolist(), store.y.tolist())
+        moved = store.copy()
+        moved.pos[:] += moved.vel / FPS # one frame of motion
+        return tree, moved
+
+    def refit(state):
+        tree, moved = state
+        tree.refit(rows.tolist(), moved.ids.tolist(), moved.x.tolist(), moved.y.tolist())
+        tree.calculate_CoM(moved.mass)
+
+    cam = Cam()
+    cam.set_pos((0, 0))
+    overview = Cam() # zoomed all the way out, where most particles are points
+    overview.set_pos((0, 0))
+    overview.zoom = MIN_ZOOM
+    drawn, group = with_handles(store) if phases is None or {"draw", "draw_overview"} & phases else (None, None)
+    surface = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+    if group is not None:
+        group.display_surface = surface
+
+    def rendered_handles(cam=cam):
+        in_render, _ = cam.filter_rendered_particles(drawn)
+        return [drawn.handles[i] for i in in_render]
+
+    table = {
+        "quadtree_insert_com": (lambda: None, lambda _: build_quadtree(QuadTree(WORLD_RECT, 1, None), store, rows)),
+        "quadtree_refit_com": (refit_setup, refit),
+        "linear_tree_build": (lambda: None, lambda _: build_quadtree(LinearQuadTree(WORLD_RECT, 1), store, rows)),
+        "query_bh_apply_forces": (lambda: None, query_per_particle),
+        "batched_forces": (lambda: None, lambda _: forces.accelerations(linear, store.x, store.y)),
+        "parallel_forces": (lambda: None, lambda _: parallel.accelerations(linear, store.x, store.y)),
+        "fmm_forces": (lambda: None, lambda _: (fmm.build(linear), fmm.accelerations(linear, store.x, store.y))),
+        "pm_forces": (lambda: None, lambda _: mesh.accelerations(linear, store.x, store.y)),
+        "direct_forces": (lambda: None, lambda _: direct.accelerations(linear, store.x, store.y)),
+        "grid_build": (lambda: None, lambda _: grid_for(store)),
+        "grid_collisions": (lambda: grid_for(store.copy()), lambda state: collide_particles(state[0], rows, state[1])),
+        "batched_collisions": (lambda: store.copy(), lambda scene: merge_collisions(scene, rows)),
+        "color_bins": (lambda: None, lambda _: calculate_color_bins(store.mass, 0)),
+        "cam_filter": (lambda: None, lambda _: cam.filter_rendered_particles(store)),
+        "draw": (rendered_handles, lambda handles: group.draw(handles, cam)),
+        "draw_overview": (lambda: rendered_handles(overview), lambda handles: group.draw(handles, overview)),
+        "step": (lambda: Simulation(store.copy()), lambda sim: sim.step(1 / FPS)),
+    }
+    if workers > 1 and (phases is None or "parallel_forces" in phases):
+        parallel = ParallelForces(workers)
+    else:
+        parallel = None
+        del table["parallel_forces"]
+    results = {}
+    for name, (setup, run) in table.items():
+        if phases is not None and name not in phases:
+            continue
+        results[name] = time_phase(setup, run, repeat)
+        print(f"  {name:<24}{results[name]['median_ms']:>10.2f} ms")
+    if parallel is not None:
+        parallel.close()
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Finds every phase that got slower than the baseline by more than the threshold.
+    Args:
+        results (dict): This run's results.
+        baseline (dict): A stored run's results.
+        threshold (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+    Returns:
+        list[str]: One line per regression.
+    """
+    regressions = []
+    for size, phases in results["results"].items():
+        for name, timing in phases.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if old is None:
+                continue
+            ratio = timing["median_ms"] / old["median_ms"] if old["median_ms"] else 1.0
+            if ratio > 1 + threshold:
+                regressions.append(f"n={size} {name}: {old['median_ms']:.2f} ms -> {timing['median_ms']:.2f} ms ({ratio:.2f}x)")
+    return regressions
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="scene sizes (particle counts)")
+    parser.add_argument("--phases", nargs="+", help="only run these phases")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per phase")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the scenes")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes for the parallel_forces phase")
+    parser.add_argument("--output", default="bench.json", help="JSON file to write results to")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    return parser.parse_args(argv)
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = parse_args(argv)
+    pygame.init()
+    pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    phases = set(args.phases) if args.phases else None
+
+    results = {
+        "meta": {"seed": args.seed, "repeat": args.repeat, "workers": args.workers, "python": platform.python_version(),
+                 "numpy": np.__version__, "pygame": pygame.version.ver, "machine": platform.machine()},
+        "results": {},
+    }
+    for n in args.sizes:
+        print(f"n={n}")
+        results["results"][str(n)] = bench_size(n, args.seed, args.repeat, phases, args.workers)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("no regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,6 @@
 from settings import *
 if TYPE_CHECKING:
-    from particle import Particle
+    from store import ParticleStore
 
 class Cam:
     """
@@ -68,20 +68,21 @@ class Cam:
     def set_pos(self, pos: Sequence[float]):
         self.pos = pygame.Vector2(pos[0], pos[1])
 
-    def filter_rendered_particles(self, particles: Sequence["Particle"]):
+    def filter_rendered_particles(self, store: "ParticleStore") -> tuple[np.ndarray, np.ndarray]:
+        """
+        Split the particles into those within render distance of the camera and the rest.
+        Args:
+            store (ParticleStore): All particles.
+        Returns:
+            tuple: store rows in render distance, store rows outside it.
+        """
         camx, camy = self.pos
         buffer_factor = 1.2
         screen_size = pygame.display.get_surface().get_size()
         render_distance = (max(MIN_RENDER_DISTANCE, max(screen_size[0], screen_size[1]) / self.zoom)) * buffer_factor
 
-        rendered_particles = []
-        p_not_in_render = []
-        for p in particles:
-            if (p.x - camx)**2 + (p.y - camy)**2 <= render_distance**2:
-                rendered_particles.append(p)
-                continue
-            p_not_in_render.append(p)
-        return rendered_particles, p_not_in_render
+        in_render = (store.x - camx)**2 + (store.y - camy)**2 <= render_distance**2
+        return np.flatnonzero(in_render), np.flatnonzero(~in_render)
 
     def update(self, dt):
         """
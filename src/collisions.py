@@ -0,0 +1,154 @@
+from settings import *
+from linear_tree import expand_ranges
+if TYPE_CHECKING:
+    from store import ParticleStore
+
+# half of the 3x3 cell neighborhood; with the same-cell pairs this visits every pair of adjacent cells once
+HALF_NEIGHBORHOOD = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+
+def find_overlapping_pairs(x: np.ndarray, y: np.ndarray, radius: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds every pair of overlapping circles with a sort-based uniform grid.
+    The cell size is the largest diameter present, so any overlapping pair sits in the same or adjacent cells.
+    Args:
+        x, y (np.ndarray): Circle centers.
+        radius (np.ndarray): Circle radii.
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Positions (into x, y, radius) of the two circles of every overlapping pair.
+    """
+    n = len(x)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    cell_size = 2 * radius.max()
+    cx = np.floor(x / cell_size).astype(np.int64)
+    cy = np.floor(y / cell_size).astype(np.int64)
+    cx -= cx.min() - 1 # keep a free column on both sides so neighbor keys never wrap
+    cy -= cy.min() - 1
+    rows = cy.max() + 2
+    keys = cx * rows + cy
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    firsts, lasts = [], []
+
+    # same cell: every particle pairs with the ones after it in sorted order
+    position = np.arange(n)
+    cell_end = np.searchsorted(sorted_keys, sorted_keys, side="right")
+    counts = cell_end - position - 1
+    firsts.append(np.repeat(position, counts))
+    lasts.append(expand_ranges(position + 1, counts))
+
+    for dx, dy in HALF_NEIGHBORHOOD:
+        neighbor_keys = sorted_keys + dx * rows + dy
+        start = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+        counts = np.searchsorted(sorted_keys, neighbor_keys, side="right") - start
+        firsts.append(np.repeat(position, counts))
+        lasts.append(expand_ranges(start, counts))
+
+    i = order[np.concatenate(firsts)]
+    j = order[np.concatenate(lasts)]
+    ddx = x[j] - x[i]
+    ddy = y[j] - y[i]
+    reach = radius[i] + radius[j]
+    overlap = ddx*ddx + ddy*ddy <= reach*reach
+    return i[overlap], j[overlap]
+
+def connected_components(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """
+    Vectorized union-find: labels every node with the smallest node index in its connected component.
+    Roots are hooked onto the smaller label of every edge, then paths are compressed by pointer jumping,
+    until no edge joins two different labels.
+    Args:
+        n (int): Number of nodes.
+        i, j (np.ndarray): The two ends of every edge.
+    Returns:
+        np.ndarray: Component label of every node.
+    """
+    parent = np.arange(n)
+    while True:
+        li, lj = parent[i], parent[j]
+        differ = li != lj
+        if not differ.any():
+            return parent
+        li, lj = li[differ], lj[differ]
+        low = np.minimum(li, lj)
+        np.minimum.at(parent, li, low)
+        np.minimum.at(parent, lj, low)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+def merge_collisions(store: "ParticleStore", indices: np.ndarray) -> int:
+    """
+    Finds every overlapping pair among the given particles and merges each cluster of touching particles into its
+    heaviest member (the oldest one on a tie), conserving mass and momentum. Merges happen all at once, so the result
+    does not depend on iteration order. Merged-away particles are only marked dead.
+    A dragged particle never merges with a heavier particle it touches, and always survives its cluster, so it is
+    never absorbed, even when its cluster reaches a heavier particle through a lighter one.
+    Args:
+        store (ParticleStore): All particles.
+        indices (np.ndarray): Rows to check for collisions.
+    Returns:
+        int: Number of particles merged away.
+    """
+    indices = indices[(store.flags[indices] & DEAD) == 0]
+    mass = store.mass[indices]
+    i, j = find_overlapping_pairs(store.x[indices], store.y[indices], store.radius[indices])
+    if i.size == 0:
+        return 0
+
+    dragged = (store.flags[indices] & DRAGGED) != 0
+    lighter = np.where((mass[i] < mass[j]) | ((mass[i] == mass[j]) & (store.ids[indices[i]] > store.ids[indices[j]])), i, j)
+    keep = ~dragged[lighter]
+    i, j = i[keep], j[keep]
+    if i.size == 0:
+        return 0
+
+    # only the particles that collided take part in the merge
+    members = np.unique(np.concatenate((i, j)))
+    local = np.searchsorted(members, i), np.searchsorted(members, j)
+    label = connected_components(len(members), *local)
+    rows = indices[members]
+    mass = store.mass[rows]
+
+    # a dragged member survives its cluster, else the heaviest, oldest on a tie
+    dragged = (store.flags[rows] & DRAGGED) != 0
+    order = np.lexsort((store.ids[rows], -mass, ~dragged, label))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = label[order[1:]] != label[order[:-1]]
+    survivors = rows[order[first]]
+    cluster = label[order[first]]
+
+    n = len(members)
+    total_mass = np.bincount(label, weights=mass, minlength=n)[cluster]
+    momentum_x = np.bincount(label, weights=mass * store.vel[rows, 0], minlength=n)[cluster]
+    momentum_y = np.bincount(label, weights=mass * store.vel[rows, 1], minlength=n)[cluster]
+    total_area = np.bincount(label, weights=math.pi * store.radius[rows]**2, minlength=n)[cluster]
+
+    store.vel[survivors, 0] = momentum_x / total_mass
+    store.vel[survivors, 1] = momentum_y / total_mass
+    store.mass[survivors] = total_mass
+    store.density[survivors] = np.clip(np.where(total_area > 0, total_mass / total_area, 1.0), 0.01, 1000)
+    store.update_radii(survivors)
+
+    absorbed = np.setdiff1d(rows, survivors, assume_unique=True)
+    store.flags[absorbed] |= DEAD
+    return len(absorbed)
+
+
+if __name__ == '__main__':
+    # a dragged particle touching a lighter one that touches a heavier one survives the three-way merge
+    from store import ParticleStore
+
+    store = ParticleStore(3)
+    dragged = store.add(0, 0, 0, 0, 5, 1, flags=DRAGGED)
+    lighter = store.add(2, 0, 0, 0, 1, 1)
+    heavier = store.add(5, 0, 0, 0, 10, 1)
+    merged = merge_collisions(store, np.arange(3))
+    assert merged == 2, merged
+    assert store.flags[dragged] & DEAD == 0 and store.flags[lighter] & DEAD and store.flags[heavier] & DEAD, store.flags
+    assert store.mass[dragged] == 16, store.mass
+    print("dragged particle kept its cluster's mass:", store.mass[dragged])
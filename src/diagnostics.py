@@ -0,0 +1,102 @@
+"""
+Conservation diagnostics: momentum, angular momentum and energy of the whole simulation, logged every few steps.
+
+The log is a CSV file with one row per measurement. Rows are buffered and written on a background thread,
+so logging costs the simulation one vectorized pass over the particles per measurement.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from settings import *
+from barnes_hut import BarnesHutForces
+from linear_tree import LinearQuadTree
+if TYPE_CHECKING:
+    from simulation import Simulation
+    from store import ParticleStore
+
+DIAGNOSTICS_COLUMNS = ["step", "time", "count", "momentum_x", "momentum_y", "angular_momentum", "kinetic", "potential", "energy"]
+
+
+def conserved_quantities(store: "ParticleStore", tree: LinearQuadTree, forces: BarnesHutForces) -> dict[str, float]:
+    """
+    Measures the quantities gravity conserves, over every simulated particle (the ones in the creation menu are
+    left out). The potential energy is the barnes-hut estimate, so it carries the same approximation as the forces.
+    Args:
+        store (ParticleStore): All particles.
+        tree (LinearQuadTree): Tree to build over the particles for the potential.
+        forces (BarnesHutForces): Evaluates the potential on the tree.
+    Returns:
+        dict[str, float]: count, momentum_x, momentum_y, angular_momentum (about the origin), kinetic, potential
+            and energy.
+    """
+    rows = np.flatnonzero((store.flags & IN_MENU) == 0)
+    x, y, mass = store.x[rows], store.y[rows], store.mass[rows]
+    vx, vy = store.vel[rows, 0], store.vel[rows, 1]
+
+    tree.build(rows, x, y, mass)
+    kinetic = 0.5 * float(np.dot(mass, vx*vx + vy*vy))
+    potential = 0.5 * float(np.dot(mass, forces.potentials(tree, x, y))) # every pair is counted twice
+    return {
+        "count": len(rows),
+        "momentum_x": float(np.dot(mass, vx)),
+        "momentum_y": float(np.dot(mass, vy)),
+        "angular_momentum": float(np.dot(mass, x*vy - y*vx)),
+        "kinetic": kinetic,
+        "potential": potential,
+        "energy": kinetic + potential,
+    }
+
+
+class DiagnosticsLog:
+    """
+    Measures conserved_quantities() every `every` steps of a simulation and appends them to a CSV file.
+    Rows are written on a background thread once `buffer_rows` of them have piled up, and on close().
+    Args:
+        path (str): CSV file. It is overwritten.
+        every (int): Steps between measurements.
+        buffer_rows (int): Rows kept in memory before they are written out.
+    """
+    def __init__(self, path: str, every: int = DIAGNOSTICS_EVERY, buffer_rows: int = 256) -> None:
+        self.path = path
+        self.every = every
+        self.buffer_rows = buffer_rows
+        self.rows: list[list[float]] = []
+        self.latest: dict[str, float] | None = None
+        world_rect = pygame.FRect(-HALF_WORLD_WIDTH, -HALF_WORLD_HEIGHT, HALF_WORLD_WIDTH * 2, HALF_WORLD_HEIGHT * 2)
+        self.tree = LinearQuadTree(world_rect, 1) # its own, so the simulation's tree is left as the step built it
+        self.forces = BarnesHutForces()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diagnostics")
+        self.pending: Future | None = None
+        with open(path, "w") as f:
+            f.write(",".join(DIAGNOSTICS_COLUMNS) + "\n")
+
+    def append(self, sim: "Simulation") -> None:
+        """
+        Measures the simulation if a measurement is due this step.
+        Args:
+            sim (Simulation): The simulation, right after a step.
+        """
+        if sim.steps % self.every:
+            return
+        self.latest = {"step": sim.steps, "time": sim.time, **conserved_quantities(sim.store, self.tree, self.forces)}
+        self.rows.append([self.latest[column] for column in DIAGNOSTICS_COLUMNS])
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Hands the buffered rows to the writer thread.
+        """
+        if not self.rows:
+            return
+        self.pending = self.writer.submit(self._write, self.rows)
+        self.rows = []
+
+    def _write(self, rows: list[list[float]]) -> None:
+        with open(self.path, "a") as f:
+            np.savetxt(f, np.array(rows), delimiter=",", fmt="%.10g")
+
+    def close(self) -> None:
+        """
+        Writes the buffered rows and waits for the writer.
+        """
+        self.flush()
+        self.writer.shutdown()
@@ -0,0 +1,88 @@
+"""
+Direct-sum gravity: every pair of particles is summed exactly, in square tiles so memory stays bounded.
+
+O(n^2), but with no tree walk it is the fastest solver for a few hundred particles, and as the exact answer it is
+the reference the approximate solvers are checked against.
+"""
+from settings import *
+from typing import Iterator
+from linear_tree import LinearQuadTree
+
+
+class DirectForces:
+    """
+    Exact pairwise force evaluation, softened like apply_forces().
+    Takes the same (tree, x, y) as BarnesHutForces.accelerations() and uses the tree's particles as the sources,
+    so only the tree's particle arrays are read.
+    Args:
+        tile (int): Targets and sources per tile. A tile holds a few (tile, tile) float arrays.
+    """
+    def __init__(self, tile: int = DIRECT_TILE) -> None:
+        self.tile = tile
+
+    def tiles(self, n_targets: int, n_sources: int) -> Iterator[tuple[slice, slice]]:
+        """
+        Yields the (targets, sources) slices of every tile.
+        Args:
+            n_targets (int): Number of positions evaluated.
+            n_sources (int): Number of source particles.
+        """
+        for first in range(0, n_targets, self.tile):
+            targets = slice(first, min(first + self.tile, n_targets))
+            for start in range(0, n_sources, self.tile):
+                yield targets, slice(start, min(start + self.tile, n_sources))
+
+    def accelerations(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Calculates the exact acceleration of every particle. A particle at the same position as a source (itself)
+        gets no force from it.
+        Args:
+            tree (LinearQuadTree): A built tree, whose particles are the sources.
+            x, y (np.ndarray): Positions of the particles.
+        Returns:
+            np.ndarray: (n, 2) accelerations.
+        """
+        return self.source_accelerations(tree.x, tree.y, tree.m, x, y)
+
+    def source_accelerations(self, source_x: np.ndarray, source_y: np.ndarray, source_m: np.ndarray,
+                             x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        accelerations() from source arrays instead of a tree, for when no tree is built.
+        Args:
+            source_x, source_y, source_m (np.ndarray): Positions and masses of the sources.
+            x, y (np.ndarray): Positions of the particles.
+        Returns:
+            np.ndarray: (n, 2) accelerations.
+        """
+        acc = np.zeros((len(x), 2))
+        for targets, sources in self.tiles(len(x), len(source_x)):
+            dx = source_x[sources] - x[targets, np.newaxis]
+            dy = source_y[sources] - y[targets, np.newaxis]
+            w = dx*dx
+            w += dy*dy
+            w += GRAVITY_SOFTENING
+            w *= np.sqrt(w)
+            np.divide(source_m[sources], w, out=w)
+            acc[targets, 0] += np.einsum("ij,ij->i", dx, w)
+            acc[targets, 1] += np.einsum("ij,ij->i", dy, w)
+        acc *= G
+        return acc
+
+    def potentials(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Calculates the exact gravitational potential at every position. A source at the same position (the particle
+        itself) is left out.
+        Args:
+            tree (LinearQuadTree): A built tree, whose particles are the sources.
+            x, y (np.ndarray): Positions to evaluate.
+        Returns:
+            np.ndarray: (n,) potentials (energy per unit mass).
+        """
+        phi = np.zeros(len(x))
+        for targets, sources in self.tiles(len(x), len(tree.x)):
+            dx = tree.x[sources] - x[targets, np.newaxis]
+            dy = tree.y[sources] - y[targets, np.newaxis]
+            d2 = dx*dx + dy*dy
+            inverse = np.where(d2 > 0, 1 / np.sqrt(d2 + GRAVITY_SOFTENING), 0.0)
+            phi[targets] -= inverse @ tree.m[sources]
+        return G * phi
@@ -0,0 +1,249 @@
+"""
+Fast multipole method for the simulation's gravity: softened G * m / r^2 forces in O(n).
+
+The force law is the 3D one evaluated in the plane, whose potential -G / sqrt(r^2 + softening) is not harmonic in 2D,
+so the complex-analytic expansions of the 2D log kernel don't apply. The expansions here are Cartesian Taylor series
+of that potential up to `order`, which work for any smooth kernel, softening included.
+
+The tree is a uniform quadtree over the world, deep enough for about FMM_LEAF_SIZE particles per leaf. Every pass
+works on a whole tree level at once: a level is a (cells, cells, terms) array of expansions, and the M2M, M2L and
+L2L translations are the same few matrices for every cell of a level, so they are cached and applied with matmul.
+"""
+from math import factorial
+from settings import *
+from linear_tree import LinearQuadTree, expand_ranges
+
+
+def multi_indices(order: int) -> np.ndarray:
+    """
+    Returns every (a, b) with a + b <= order, sorted by a + b. Term t of an expansion belongs to x^a y^b.
+    """
+    return np.array([(a, n - a) for n in range(order + 1) for a in range(n, -1, -1)], dtype=np.int64)
+
+def monomials(dx: np.ndarray, dy: np.ndarray, order: int) -> np.ndarray:
+    """
+    Returns dx^a dy^b / (a! b!) for every (a, b) of multi_indices(order).
+    Args:
+        dx, dy (np.ndarray): Offsets, any shape.
+        order (int): Highest a + b.
+    Returns:
+        np.ndarray: dx.shape + (terms,) array.
+    """
+    dx, dy = np.asarray(dx, dtype=np.float64), np.asarray(dy, dtype=np.float64)
+    px = [np.ones_like(dx)]
+    py = [np.ones_like(dy)]
+    for k in range(1, order + 1):
+        px.append(px[-1] * dx / k)
+        py.append(py[-1] * dy / k)
+    return np.stack([px[a] * py[b] for a, b in multi_indices(order)], axis=-1)
+
+def kernel_derivatives(rx: np.ndarray, ry: np.ndarray, order: int) -> np.ndarray:
+    """
+    Returns every partial derivative d^(a+b) / dx^a dy^b, a + b <= order, of the potential K(r) = -G / sqrt(r^2 + eps),
+    with the McMurchie-Davidson recurrence on F_j = d^j K / du^j, u = r^2 / 2.
+    Args:
+        rx, ry (np.ndarray): 1D arrays of offsets to evaluate at.
+        order (int): Highest a + b.
+    Returns:
+        np.ndarray: (len(rx), terms) derivatives, in multi_indices(order) order.
+    """
+    r2 = rx*rx + ry*ry + GRAVITY_SOFTENING
+    # R[j][(a, b)] = d^a/dx^a d^b/dy^b F_j
+    R = [{(0, 0): -G * (-1)**j * np.prod(np.arange(1.0, 2*j, 2)) * r2 ** (-(2*j + 1) / 2)} for j in range(order + 1)]
+    for n in range(1, order + 1):
+        for j in range(order - n + 1):
+            for a in range(n + 1):
+                b = n - a
+                if a:
+                    value = rx * R[j + 1][(a - 1, b)]
+                    if a > 1:
+                        value = value + (a - 1) * R[j + 1][(a - 2, b)]
+                else:
+                    value = ry * R[j + 1][(a, b - 1)]
+                    if b > 1:
+                        value = value + (b - 1) * R[j + 1][(a, b - 2)]
+                R[j][(a, b)] = value
+    return np.stack([R[0][(a, b)] for a, b in multi_indices(order)], axis=-1)
+
+
+class FMMForces:
+    """
+    Fast multipole force evaluation. Takes the same (tree, x, y) as BarnesHutForces.accelerations() and uses the
+    tree's sorted particles as the sources, so it can be swapped in for it.
+    Args:
+        order (int): Expansion order. Higher is more accurate and slower (the work per cell grows like order^4).
+        leaf_size (int): Average particles per leaf the tree depth is picked for.
+        max_level (int): Deepest tree level.
+        chunk_size (int): Max target particles whose near field is summed at once.
+    """
+    def __init__(self, order: int = FMM_ORDER, leaf_size: int = FMM_LEAF_SIZE, max_level: int = 8, chunk_size: int = 2048) -> None:
+        self.order = order
+        self.leaf_size = leaf_size
+        self.max_level = max_level
+        self.chunk_size = chunk_size
+        self.terms = multi_indices(order)
+        index = {(a, b): t for t, (a, b) in enumerate(self.terms.tolist())}
+        # local expansion terms that make up the x and y gradient, one order down
+        self.grad_x = np.array([index[(a + 1, b)] for a, b in multi_indices(order - 1)])
+        self.grad_y = np.array([index[(a, b + 1)] for a, b in multi_indices(order - 1)])
+        self._translations: dict[tuple, tuple] = {}
+        self._sources = None # the tree.x the expansions were built for
+
+    def translations(self, boundary: pygame.FRect, level: int) -> tuple:
+        """
+        Returns the cached translation matrices of a level (cells of the level, parents one level up).
+        Args:
+            boundary (pygame.FRect): Bounds of the root cell.
+            level (int): Tree level, >= 2.
+        Returns:
+            tuple:
+                - m2m (dict): (a, b) -> matrix taking the multipoles of the children at [a::2, b::2] to their parents.
+                - l2l (dict): (a, b) -> matrix taking the parents' local expansions to the children at [a::2, b::2].
+                - m2l (dict): (a, b) -> (offsets, stacked matrix) for the cells at [a::2, b::2]: the multipoles of
+                    the cells at those offsets, concatenated, times the matrix give their local expansions.
+        """
+        key = (boundary.width, boundary.height, level)
+        if key in self._translations:
+            return self._translations[key]
+        p = self.order
+        terms = self.terms
+        hx, hy = boundary.width / (1 << level), boundary.height / (1 << level)
+        k_minus_n = terms[np.newaxis, :, :] - terms[:, np.newaxis, :] # [n, k] -> k - n
+        def shift(t: tuple[float, float], powers: np.ndarray) -> np.ndarray:
+            # t^powers / powers! where every power is >= 0, else 0
+            valid = (powers >= 0).all(axis=-1)
+            powers = np.maximum(powers, 0)
+            values = np.vectorize(lambda a, b: t[0]**a * t[1]**b / (factorial(a) * factorial(b)))(powers[..., 0], powers[..., 1])
+            return np.where(valid, values, 0.0)
+
+        m2m, l2l = {}, {}
+        for a in (0, 1):
+            for b in (0, 1):
+                t = ((a - 0.5) * hx, (b - 0.5) * hy) # child center - parent center
+                m2m[(a, b)] = shift(t, -k_minus_n).T # M'_n = sum_k M_k t^(n-k)/(n-k)!, applied as M @ m2m
+                l2l[(a, b)] = shift(t, k_minus_n).T # L'_n = sum_m L_m t^(m-n)/(m-n)!
+
+        # M2L: L_n = sum_k (-1)^|k| M_k D_(k+n)(c_target - c_source)
+        offsets = [(ox, oy) for ox in range(-3, 4) for oy in range(-3, 4) if max(abs(ox), abs(oy)) > 1]
+        ox, oy = np.array(offsets, dtype=np.float64).T
+        derivatives = kernel_derivatives(-ox * hx, -oy * hy, 2 * p)
+        index = {(a, b): t for t, (a, b) in enumerate(multi_indices(2 * p).tolist())}
+        k_plus_n = np.array([[index[(n[0] + k[0], n[1] + k[1])] for k in terms.tolist()] for n in terms.tolist()])
+        sign = (-1.0) ** terms.sum(axis=1)
+        matrices = {offset: (derivatives[o][k_plus_n] * sign).T for o, offset in enumerate(offsets)} # applied as M @ matrix
+        m2l = {}
+        for a in (0, 1):
+            for b in (0, 1):
+                # only the children of the parent's neighbors that aren't neighbors themselves
+                used = [(ox, oy) for ox, oy in offsets if -2 <= a + ox <= 3 and -2 <= b + oy <= 3]
+                m2l[(a, b)] = (used, np.concatenate([matrices[offset] for offset in used], axis=0))
+        self._translations[key] = (m2m, l2l, m2l)
+        return self._translations[key]
+
+    def cells(self, boundary: pygame.FRect, x: np.ndarray, y: np.ndarray, level: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (ix, iy) cell of every position on a level, clamped to the grid.
+        """
+        n = 1 << level
+        ix = np.clip(((x - boundary.left) * (n / boundary.width)).astype(np.int64), 0, n - 1)
+        iy = np.clip(((y - boundary.top) * (n / boundary.height)).astype(np.int64), 0, n - 1)
+        return ix, iy
+
+    def build(self, tree: LinearQuadTree) -> None:
+        """
+        Upward and downward passes over the tree's particles: leaf multipoles (P2M), multipoles of every level (M2M),
+        then local expansions of the far field of every cell (M2L, L2L). Also sorts the sources by leaf for the
+        near field.
+        Args:
+            tree (LinearQuadTree): A built tree.
+        """
+        bounds = tree.boundary
+        n_sources = len(tree.x)
+        depth = int(np.clip(np.ceil(np.log(max(n_sources, 1) / self.leaf_size) / np.log(4)), 2, self.max_level))
+        cells = 1 << depth
+        ix, iy = self.cells(bounds, tree.x, tree.y, depth)
+        leaf = ix * cells + iy
+        order = np.argsort(leaf, kind="stable")
+        self.depth = depth
+        self.boundary = pygame.FRect(bounds)
+        self.source_x, self.source_y, self.source_m = tree.x[order], tree.y[order], tree.m[order]
+        self.leaf_count = np.bincount(leaf, minlength=cells * cells).reshape(cells, cells)
+        self.leaf_start = (np.cumsum(self.leaf_count.ravel()) - self.leaf_count.ravel()).reshape(cells, cells)
+
+        # P2M
+        hx, hy = bounds.width / cells, bounds.height / cells
+        dx = tree.x - (bounds.left + (ix + 0.5) * hx)
+        dy = tree.y - (bounds.top + (iy + 0.5) * hy)
+        weighted = monomials(dx, dy, self.order) * tree.m[:, np.newaxis]
+        terms = len(self.terms)
+        multipoles = {depth: np.stack([np.bincount(leaf, weights=weighted[:, t], minlength=cells * cells) for t in range(terms)],
+                                      axis=-1).reshape(cells, cells, terms)}
+        # M2M
+        for level in range(depth - 1, 1, -1):
+            m2m = self.translations(bounds, level + 1)[0]
+            children = multipoles[level + 1]
+            multipoles[level] = sum(children[a::2, b::2] @ m2m[(a, b)] for a, b in m2m)
+        # M2L and L2L
+        local = None
+        for level in range(2, depth + 1):
+            m2m, l2l, m2l = self.translations(bounds, level)
+            n = 1 << level
+            padded = np.zeros((n + 6, n + 6, terms))
+            padded[3:n + 3, 3:n + 3] = multipoles[level]
+            current = np.zeros((n, n, terms))
+            for (a, b), (used, matrix) in m2l.items():
+                sources = np.concatenate([padded[3 + a + ox:3 + a + ox + n:2, 3 + b + oy:3 + b + oy + n:2] for ox, oy in used], axis=-1)
+                current[a::2, b::2] = sources @ matrix
+                if local is not None:
+                    current[a::2, b::2] += local @ l2l[(a, b)]
+            local = current
+        self.local = local
+        self._sources = tree.x
+
+    def accelerations(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Calculates the acceleration of every particle: the far field from its leaf's local expansion (L2P), plus a
+        direct sum over the particles in its own and the 8 neighboring leaves.
+        The expansions are only rebuilt when the tree was.
+        Args:
+            tree (LinearQuadTree): A built tree, whose particles are the sources.
+            x, y (np.ndarray): Positions of the particles.
+        Returns:
+            np.ndarray: (n, 2) accelerations.
+        """
+        n = len(x)
+        acc = np.zeros((n, 2))
+        if n == 0 or len(tree.x) == 0:
+            return acc
+        if self._sources is not tree.x:
+            self.build(tree)
+
+        # L2P
+        bounds = self.boundary
+        cells = 1 << self.depth
+        ix, iy = self.cells(bounds, x, y, self.depth)
+        dx = x - (bounds.left + (ix + 0.5) * (bounds.width / cells))
+        dy = y - (bounds.top + (iy + 0.5) * (bounds.height / cells))
+        powers = monomials(dx, dy, self.order - 1)
+        local = self.local[ix, iy]
+        acc[:, 0] = -np.einsum("ij,ij->i", powers, local[:, self.grad_x])
+        acc[:, 1] = -np.einsum("ij,ij->i", powers, local[:, self.grad_y])
+
+        # near field, P2P
+        neighbors = np.array([(ox, oy) for ox in (-1, 0, 1) for oy in (-1, 0, 1)])
+        for start in range(0, n, self.chunk_size):
+            chunk = slice(start, min(start + self.chunk_size, n))
+            nx = ix[chunk, np.newaxis] + neighbors[:, 0]
+            ny = iy[chunk, np.newaxis] + neighbors[:, 1]
+            inside = (nx >= 0) & (nx < cells) & (ny >= 0) & (ny < cells)
+            nx, ny = np.clip(nx, 0, cells - 1), np.clip(ny, 0, cells - 1)
+            counts = np.where(inside, self.leaf_count[nx, ny], 0)
+            sources = expand_ranges(self.leaf_start[nx, ny].ravel(), counts.ravel())
+            owner = np.repeat(np.arange(chunk.stop - chunk.start), counts.sum(axis=1))
+            sx = self.source_x[sources] - x[chunk][owner]
+            sy = self.source_y[sources] - y[chunk][owner]
+            r2 = sx*sx + sy*sy + GRAVITY_SOFTENING
+            w = G * self.source_m[sources] / (r2 * np.sqrt(r2))
+            acc[chunk, 0] += np.bincount(owner, weights=sx * w, minlength=chunk.stop - chunk.start)
+            acc[chunk, 1] += np.bincount(owner, weights=sy * w, minlength=chunk.stop - chunk.start)
+        return acc
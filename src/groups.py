@@ -1,7 +1,18 @@
+from functools import cache
 from settings import *
+from sprite_cache import sprite_cache
 if TYPE_CHECKING:
     from particle import Particle
     from cam import Cam
+    from store import ParticleStore
+
+@cache
+def disc_offsets(radius: int) -> list[tuple[int, int]]:
+    """
+    Returns the pixel offsets covered by a disc of the given integer radius around a pixel.
+    """
+    return [(dx, dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1) if dx*dx + dy*dy <= radius*radius]
+
 
 class ParticleDrawing(pygame.sprite.Group):
     """
@@ -15,13 +26,15 @@ class ParticleDrawing(pygame.sprite.Group):
         self.display_surface = pygame.display.get_surface()
         self.offset = pygame.Vector2()
 
-    def draw(self, particles_in_render: Sequence["Particle"], cam: "Cam"):
+    def draw(self, particles_in_render: Sequence["Particle"], cam: "Cam", alpha: float = 1.0):
         """
         Draw all particles in the group, applying camera offset and zoom.
-        Sprites being dragged are drawn on top of others.
+        Particles smaller than LOD_RADIUS on screen are splatted as points, the rest are drawn as sprites.
+        Sprites being dragged are drawn on top of others, and selected or dragged ones get a highlight ring.
         Args:
             particles_in_render: particles in render distance.
             cam: Camera object for position and zoom.
+            alpha: Interpolation factor of the splatted positions, see Simulation.advance().
         """
         target_pos = cam.pos
         zoom = cam.zoom
@@ -30,15 +43,73 @@ class ParticleDrawing(pygame.sprite.Group):
         self.offset.x = (-target_pos[0] * zoom) + (win_w / 2)
         self.offset.y = (-target_pos[1] * zoom) + (win_h / 2)    
         
-        other_particles = [particle for particle in particles_in_render if hasattr(particle, 'being_dragged') and particle.being_dragged == False]
-        dragged_particle = [particle for particle in particles_in_render if hasattr(particle, 'being_dragged') and particle.being_dragged ==  True]
-        
-        for layer in [other_particles, dragged_particle]:
-            for sprite in layer:
-                if not sprite.alive():
-                    continue
-                
-                zoomed_image = pygame.transform.rotozoom(sprite.image, 0, zoom)
-                zoomed_rect = zoomed_image.get_frect(center = (sprite.rect.centerx * zoom, sprite.rect.centery * zoom) + self.offset)
-                
-                self.display_surface.blit(zoomed_image, zoomed_rect)
+        # flags are read for all particles at once rather than through each handle
+        particles = [particle for particle in particles_in_render if particle.index is not None]
+        if not particles:
+            return
+        store = particles[0].store
+        rows = np.fromiter((particle.index for particle in particles), dtype=np.int64, count=len(particles))
+        flags = store.flags[rows]
+        highlighted = (flags & (INFO | DRAGGED)) != 0
+        sprites = np.ones(len(rows), dtype=bool)
+        if LOD_RADIUS > 0:
+            # highlighted particles keep their sprite so the ring shows
+            candidates = np.flatnonzero(~highlighted)
+            sprites[candidates] = ~self.draw_points(store, rows[candidates], zoom, alpha)
+        dragged = (flags & DRAGGED) != 0
+
+        # screen centers of all sprites at once, then one batched blit
+        order = np.concatenate((np.flatnonzero(sprites & ~dragged), np.flatnonzero(sprites & dragged)))
+        centers = np.array([particles[i].rect.center for i in order.tolist()]).reshape(-1, 2) * zoom + self.offset
+        level = sprite_cache.level(zoom)
+        blits = []
+        for i, (x, y) in zip(order.tolist(), centers.tolist()):
+            zoomed_image = sprite_cache.lookup(*particles[i].sprite_key, level)
+            blits.append((zoomed_image, (x - zoomed_image.get_width() / 2, y - zoomed_image.get_height() / 2)))
+        self.display_surface.fblits(blits)
+        for i, (x, y) in zip(order.tolist(), centers.tolist()):
+            if highlighted[i]:
+                particles[i].draw_highlight(self.display_surface, (x, y), zoom)
+
+    def draw_points(self, store: "ParticleStore", rows: np.ndarray, zoom: float, alpha: float) -> np.ndarray:
+        """
+        Splats every particle whose on-screen radius is below LOD_RADIUS straight into the display's pixels,
+        all at once, as discs with their radius rounded to whole pixels (a single pixel below half a pixel).
+        Args:
+            store: Store the particles are in.
+            rows: Rows of the particles to consider.
+            zoom: Camera zoom.
+            alpha: Interpolation factor between the previous and current positions.
+        Returns:
+            np.ndarray: Which of the rows were splatted.
+        """
+        radius = store.radius[rows] * zoom
+        small = radius < LOD_RADIUS
+        if not small.any():
+            return small
+
+        points = rows[small]
+        pos = store.prev_pos[points] + (store.pos[points] - store.prev_pos[points]) * alpha if alpha < 1 else store.pos[points]
+        xs = np.rint(pos[:, 0] * zoom + self.offset.x).astype(np.int64)
+        ys = np.rint(pos[:, 1] * zoom + self.offset.y).astype(np.int64)
+        # color_idx -1 (not colored yet) picks the last entry, the same red Particle.color falls back to
+        palette = [*PARTICLE_COLORS, pygame.Color("red")]
+        if self.display_surface.get_bytesize() == 4:
+            pixels = pygame.surfarray.pixels2d(self.display_surface)
+            colors = np.array([self.display_surface.map_rgb(color) for color in palette], dtype=pixels.dtype)
+        else:
+            pixels = pygame.surfarray.pixels3d(self.display_surface)
+            colors = np.array([tuple(pygame.Color(color))[:3] for color in palette], dtype=pixels.dtype)
+        colors = colors[store.color_idx[points]]
+
+        width, height = pixels.shape[:2]
+        levels = np.rint(radius[small]).astype(np.int64)
+        for level in np.unique(levels).tolist():
+            group = levels == level
+            x0, y0, color = xs[group], ys[group], colors[group]
+            for dx, dy in disc_offsets(level):
+                x, y = x0 + dx, y0 + dy
+                inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+                pixels[x[inside], y[inside]] = color[inside]
+        del pixels # unlocks the display
+        return small
@@ -0,0 +1,126 @@
+"""
+Headless batch runner: steps the simulation with no window, no sprites and no frame cap.
+
+    python src/headless.py --particles 10000 --seed 1 --dt 0.016 --steps 5000 --output run.npz
+    python src/headless.py --resume autosave.snap --autosave autosave.snap --steps 5000
+    python src/headless.py --steps 100000 --record run.traj && python src/main.py --play run.traj
+    python src/headless.py --steps 5000 --dt 0.05 --diagnostics run.csv --diagnostics-every 10
+    python src/headless.py --particles 10000 --opening relative --autotune --target-error 0.005
+"""
+import argparse
+from settings import *
+from diagnostics import DiagnosticsLog
+from barnes_hut import OPENING_CRITERIA
+from integrators import INTEGRATORS, total_energy
+from simulation import Simulation
+from snapshot import Autosaver, load_snapshot
+from trajectory import TrajectoryRecorder
+from tuning import ThetaTuner
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the gravity simulation without a display.")
+    parser.add_argument("--particles", type=int, default=NUM_PARTICLES, help="number of particles to start with")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the starting particles")
+    parser.add_argument("--dt", type=float, default=1 / FPS, help="time step in seconds")
+    parser.add_argument("--steps", type=int, default=1000, help="number of steps to run")
+    parser.add_argument("--workers", type=int, default=FORCE_WORKERS, help="force worker processes (<= 1 runs forces serially)")
+    parser.add_argument("--solver", choices=["barnes_hut", "fmm", "pm", "direct"], default=GRAVITY_SOLVER,
+                        help="gravity solver. at 100k particles fmm is the fastest (~0.4 s per evaluation), then pm (~1 s) and barnes_hut (~5 s); "
+                             "pm drops near-neighbor forces if PM_SHORT_RANGE is off in settings")
+    parser.add_argument("--theta", type=float, default=BH_THETA, help="barnes-hut opening angle")
+    parser.add_argument("--opening", choices=OPENING_CRITERIA, default=BH_OPENING, help="barnes-hut opening criterion")
+    parser.add_argument("--autotune", action=argparse.BooleanOptionalAction, default=BH_AUTOTUNE,
+                        help="adjust theta every step to keep the sampled barnes-hut force error at --target-error")
+    parser.add_argument("--target-error", type=float, default=BH_TARGET_ERROR, help="median relative force error the auto-tuner aims for")
+    parser.add_argument("--output", help="write the final particle state to this .npz file")
+    parser.add_argument("--resume", metavar="SNAPSHOT", help="start from a snapshot instead of random particles")
+    parser.add_argument("--autosave", metavar="SNAPSHOT", help="snapshot the run to this file in the background")
+    parser.add_argument("--autosave-interval", type=float, default=HEADLESS_AUTOSAVE_INTERVAL, metavar="SECONDS",
+                        help="wall-clock seconds between autosaves")
+    parser.add_argument("--integrator", choices=sorted(INTEGRATORS), default=INTEGRATOR, help="integration scheme")
+    parser.add_argument("--energy", action="store_true", help="report the relative energy drift of the run (O(n^2) at the start and end)")
+    parser.add_argument("--block-timesteps", action="store_true", default=BLOCK_TIMESTEPS,
+                        help="give every particle its own power-of-two fraction of the step")
+    parser.add_argument("--record", metavar="TRAJECTORY", help="record every step to this trajectory file")
+    parser.add_argument("--diagnostics", metavar="CSV", help="log momentum, angular momentum and energy to this file")
+    parser.add_argument("--diagnostics-every", type=int, default=DIAGNOSTICS_EVERY, metavar="K", help="steps between diagnostics")
+    parser.add_argument("--progress-every", type=int, default=0, metavar="K", help="print progress every K steps (0 = never)")
+    return parser.parse_args(argv)
+
+def save_state(sim: Simulation, path: str) -> None:
+    """
+    Writes the particle columns of a simulation to an .npz file.
+    Args:
+        sim (Simulation): The simulation to save.
+        path (str): Output file.
+    """
+    store = sim.store
+    np.savez(path, ids=store.ids, pos=store.pos, vel=store.vel, mass=store.mass, density=store.density,
+             time=sim.time, steps=sim.steps)
+
+def run(args: argparse.Namespace) -> Simulation:
+    """
+    Builds a seeded simulation and steps it as fast as possible.
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    Returns:
+        Simulation: The simulation after the last step.
+    """
+    sim = Simulation(workers=args.workers, integrator=args.integrator, solver=args.solver)
+    sim.block_timesteps = args.block_timesteps
+    if args.solver == "barnes_hut":
+        sim.forces.theta, sim.forces.opening = args.theta, args.opening
+        sim.tuner = ThetaTuner(sim.forces, args.target_error) if args.autotune else None
+    if args.resume:
+        sim.load(load_snapshot(args.resume))
+    else:
+        sim.make_particles(args.particles, np.random.default_rng(args.seed))
+    autosaver = Autosaver(args.autosave, args.autosave_interval) if args.autosave else None
+    if args.record:
+        sim.recorder = TrajectoryRecorder(args.record)
+    if args.diagnostics:
+        sim.diagnostics = DiagnosticsLog(args.diagnostics, args.diagnostics_every)
+
+    start_energy = total_energy(sim.store) if args.energy else None
+
+    start = time.perf_counter()
+    for step in range(1, args.steps + 1):
+        sim.step(args.dt)
+        sim.profiler.end_frame()
+        if autosaver:
+            autosaver.update(sim.store, sim.time, sim.steps)
+        if args.progress_every and step % args.progress_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"step {step}/{args.steps}: {len(sim.store)} particles, {step / elapsed:.1f} steps/s")
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.steps} steps in {elapsed:.2f} s ({args.steps / elapsed if elapsed else float('inf'):.1f} steps/s), "
+          f"{len(sim.store)} particles left")
+    for name, (p50, p95, p99) in sim.profiler.percentiles().items():
+        print(f"  {name:<12} p50 {p50:8.2f}  p95 {p95:8.2f}  p99 {p99:8.2f} ms")
+    if sim.block_stats is not None:
+        stats = sim.block_stats
+        print(f"  last step: {stats['levels'].tolist()} particles per block level, "
+              f"{stats['evaluations']} force evaluations ({stats['shared_evaluations']} with a shared dt), "
+              f"{stats['builds']} tree builds")
+    if sim.tuner is not None and sim.tuner.error is not None:
+        print(f"  theta {sim.forces.theta:.3f} ({sim.forces.opening}): median force error {sim.tuner.error:.2e} "
+              f"(target {sim.tuner.target:.0e}), {sim.tuner.interactions:.0f} interactions per particle")
+    if start_energy is not None:
+        drift = (total_energy(sim.store) - start_energy) / abs(start_energy) if start_energy else float("nan")
+        scheme = "block leapfrog" if sim.block_timesteps else sim.integrator.name
+        print(f"  energy drift {drift:+.3e} ({scheme}, merges and wall bounces count too)")
+    if args.output:
+        save_state(sim, args.output)
+        print(f"wrote {args.output}")
+    if autosaver:
+        autosaver.save(sim.store, sim.time, sim.steps)
+        autosaver.close()
+        print(f"wrote {args.autosave}")
+    sim.close()
+    return sim
+
+
+if __name__ == '__main__':
+    run(parse_args())
@@ -0,0 +1,77 @@
+from settings import *
+if TYPE_CHECKING:
+    from cam import Cam
+    from store import ParticleStore
+
+
+def make_colormap(stops: Sequence[tuple[int, int, int]], size: int = 256) -> np.ndarray:
+    """
+    Builds a color lookup table by linearly blending between evenly spaced color stops.
+    Args:
+        stops: Colors from lowest to highest value.
+        size: Number of entries.
+    Returns:
+        np.ndarray: (size, 3) uint8 colors.
+    """
+    stops = np.array(stops, dtype=np.float64)
+    at = np.linspace(0, len(stops) - 1, size)
+    return np.column_stack([np.interp(at, np.arange(len(stops)), stops[:, channel]) for channel in range(3)]).astype(np.uint8)
+
+
+class DensityHeatmap:
+    """
+    Far-field layer: every particle's mass binned into a screen-space 2D histogram and drawn as a color-mapped
+    image under the sprites, so the global structure shows without drawing each particle.
+    The image is rebuilt every `every` frames, and whenever the camera moves or zooms.
+    Args:
+        cell (int): Screen pixels per histogram cell.
+        every (int): Frames between rebuilds while the camera is still.
+    """
+    def __init__(self, cell: int = HEATMAP_CELL, every: int = HEATMAP_EVERY) -> None:
+        self.cell = cell
+        self.every = every
+        self.enabled = HEATMAP
+        self.colormap = make_colormap(HEATMAP_COLORS)
+        self.image: pygame.Surface | None = None
+        self.view = None # (cam x, cam y, zoom, window size) the image was built for
+        self.frames = 0
+
+    def build(self, store: "ParticleStore", cam: "Cam", size: tuple[int, int]) -> pygame.Surface:
+        """
+        Bins the particles' mass into screen cells and color-maps the log of each cell's mass.
+        Args:
+            store: Particles to bin.
+            cam: Camera that sets what is on screen.
+            size: Window size in pixels.
+        Returns:
+            pygame.Surface: The heatmap, scaled up to the window size.
+        """
+        win_w, win_h = size
+        cols, rows = -(-win_w // self.cell), -(-win_h // self.cell)
+        x = np.floor(((store.x - cam.pos.x) * cam.zoom + win_w / 2) / self.cell).astype(np.int64)
+        y = np.floor(((store.y - cam.pos.y) * cam.zoom + win_h / 2) / self.cell).astype(np.int64)
+        on_screen = (x >= 0) & (x < cols) & (y >= 0) & (y < rows)
+        mass = np.bincount(x[on_screen] * rows + y[on_screen], weights=store.mass[on_screen], minlength=cols * rows)
+
+        level = np.log1p(mass)
+        top = level.max()
+        shade = (level * ((len(self.colormap) - 1) / top)).astype(np.int64) if top > 0 else np.zeros(len(level), dtype=np.int64)
+        image = pygame.surfarray.make_surface(self.colormap[shade].reshape(cols, rows, 3))
+        image = pygame.transform.smoothscale(image, (cols * self.cell, rows * self.cell))
+        image.set_colorkey(self.colormap[0].tolist()) # empty cells show the background
+        return image
+
+    def draw(self, surface: pygame.Surface, store: "ParticleStore", cam: "Cam") -> None:
+        """
+        Draws the heatmap, rebuilding it first if it is due or the view changed.
+        Args:
+            surface: Surface to draw on.
+            store: Particles to show.
+            cam: Camera that sets what is on screen.
+        """
+        view = (cam.pos.x, cam.pos.y, cam.zoom, surface.get_size())
+        if self.image is None or view != self.view or self.frames % self.every == 0:
+            self.image = self.build(store, cam, view[3])
+            self.view = view
+        self.frames += 1
+        surface.blit(self.image, (0, 0))
@@ -9,6 +9,8 @@ def display_hints(logprinter):
     type = "hint"
     hints = [
         "You can refill the simulation with particles by pressing r!",
+        "Press h to see where all the mass is, even the particles too far away to draw!",
+        "Press F5 to save the simulation and F9 to load it back!" + (" It also autosaves every few minutes!" if AUTOSAVE_INTERVAL > 0 else ""),
         "You CANT turn off hints. Cry about it until the next update where I implement this.",
         "Im not updating this ever, too lazy. (/j)",
         "You can stop tracking a particle's info by pressing escape!",
@@ -26,8 +26,17 @@ class Input:
         key_just_pressed = pygame.key.get_just_pressed()
         key_held = pygame.key.get_pressed()
 
+        # recorded runs can only be watched, not edited
+        playback = self.game.player is not None
+        if playback:
+            self.get_playback_input(key_just_pressed, key_held)
+
+        # a dragged particle can be merged away mid-drag
+        if self.dragged_particle and not self.dragged_particle.alive():
+            self.dragged_particle = None
+
         # drag particles with left click
-        if mouse_presses[0]:
+        if mouse_presses[0] and not playback:
             if self.dragged_particle:
                 # drag the particle
                 self.dragged_particle.rect.center = world_mouse_pos
@@ -36,7 +45,7 @@ class Input:
                 self.dragged_particle.v = (world_mouse_pos - self.old_world_mouse_pos) / dt
             else:
                 # find what particle (if any) was dragged and label it as the dragged particle
-                particle = find_particle(self.game.particles, world_mouse_pos)
+                particle = find_particle(self.game.store, world_mouse_pos)
                 if self.particle_menu:
                     if particle == self.particle_menu.menu_particle:
                         particle = None
@@ -55,7 +64,7 @@ class Input:
         # display particle info with right click
         if mouse_presses[2]:
             if not self.info_particle:
-                particle = find_particle(self.game.particles, world_mouse_pos)
+                particle = find_particle(self.game.store, world_mouse_pos)
                 if particle:
                     self.info_particle = particle
                     self.info_particle.info = True
@@ -79,12 +88,12 @@ class Input:
                 self.info_particle = None
 
         # opens + closes particle creation menu
-        if key_just_pressed[pygame.K_RETURN]:
+        if key_just_pressed[pygame.K_RETURN] and not playback:
             if not self.particle_menu:
                 if len(self.game.particles) >= MAX_PARTICLES:
                     self.game.logprinter.print(f"There are too many particles!", type="error")
                     return
-                self.particle_menu = ParticleCreationMenu(self.game.font, self.game.manager, (self.game.particles, self.game.particles), self.game.particles)
+                self.particle_menu = ParticleCreationMenu(self.game.font, self.game.manager, (self.game.particles, self.game.particles), self.game.store)
             else:
                 self.info_particle = self.particle_menu.menu_particle
                 self.info_particle.info = True
@@ -92,7 +101,7 @@ class Input:
                 self.particle_menu = None
         
         # deletes particle thats being interacted with
-        if key_just_pressed[pygame.K_BACKSPACE]:
+        if key_just_pressed[pygame.K_BACKSPACE] and not playback:
             if self.info_particle:
                 self.info_particle.kill()
                 self.info_particle = None
@@ -101,7 +110,7 @@ class Input:
                 self.dragged_particle = None
 
         # repopulates the simulation until there are NUM_PARTICLES particles in it.
-        if key_just_pressed[pygame.K_r]:
+        if key_just_pressed[pygame.K_r] and not playback:
             if len(self.game.particles) >= NUM_PARTICLES:
                 self.game.logprinter.print("Theres already enough particles!", type="error")
                 return
@@ -109,8 +118,53 @@ class Input:
             self.game.make_particles(num_particles_to_make)
             self.game.logprinter.print(f"Made {num_particles_to_make} particles!", type="info")
 
+        # F5 saves the simulation, F9 loads the last save
+        if key_just_pressed[pygame.K_F5] and not playback:
+            self.game.quicksave()
+            self.game.logprinter.print(f"Saved the simulation to {AUTOSAVE_PATH}!", type="info")
+        if key_just_pressed[pygame.K_F9] and not playback:
+            if self.particle_menu:
+                self.game.logprinter.print("Close the particle menu before loading!", type="error")
+                return
+            try:
+                self.game.quickload()
+            except (OSError, ValueError) as error:
+                self.game.logprinter.print(f"Couldnt load {AUTOSAVE_PATH}: {error}", type="error")
+                return
+            self.dragged_particle = self.info_particle = None
+            self.game.logprinter.print(f"Loaded {len(self.game.particles)} particles from {AUTOSAVE_PATH}!", type="info")
+
+        # toggles the density heatmap
+        if key_just_pressed[pygame.K_h]:
+            self.game.heatmap.enabled = not self.game.heatmap.enabled
+
         # sets debug mode on
         if key_just_pressed[pygame.K_PERIOD]:
             self.game.debug = not self.game.debug
 
         self.old_world_mouse_pos = world_mouse_pos
+
+    def get_playback_input(self, key_just_pressed, key_held):
+        """
+        Handle the playback controls: SPACE pauses, LEFT/RIGHT step back/forward (10 steps with LSHIFT),
+        UP/DOWN double/halve the playback speed.
+        Args:
+            key_just_pressed: keys pressed this frame.
+            key_held: keys held down.
+        """
+        player = self.game.player
+        if key_just_pressed[pygame.K_SPACE]:
+            if player.paused and player.position == len(player) - 1:
+                player.seek(0)
+            player.paused = not player.paused
+        step = 10 if key_held[pygame.K_LSHIFT] else 1
+        if key_just_pressed[pygame.K_RIGHT]:
+            player.paused = True
+            player.seek(player.position + step)
+        if key_just_pressed[pygame.K_LEFT]:
+            player.paused = True
+            player.seek(player.position - step)
+        if key_just_pressed[pygame.K_UP]:
+            player.speed = min(player.speed * 2, 64)
+        if key_just_pressed[pygame.K_DOWN]:
+            player.speed = max(player.speed / 2, 1 / 16)
@@ -0,0 +1,100 @@
+from settings import *
+from contextlib import nullcontext
+from typing import Callable
+if TYPE_CHECKING:
+    from store import ParticleStore
+
+# 4th order Yoshida weights: three leapfrog steps of these fractions of dt (the middle one goes backwards)
+YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+YOSHIDA_W0 = -(2 ** (1 / 3)) * YOSHIDA_W1
+
+
+def window_collisions(store: "ParticleStore", indices: np.ndarray) -> None:
+    """
+    Bounces particles off the world borders, clamping them back inside.
+    Args:
+        store (ParticleStore): All particles.
+        indices (np.ndarray): Rows to check.
+    """
+    radius = store.radius[indices]
+    for axis, half_size in ((0, HALF_WORLD_WIDTH), (1, HALF_WORLD_HEIGHT)):
+        pos = store.pos[indices, axis]
+        low = pos - radius < -half_size
+        high = pos + radius > half_size
+        pos = np.where(low, -half_size + radius, pos)
+        pos = np.where(high, half_size - radius, pos)
+        store.pos[indices, axis] = pos
+        hit = low | high
+        store.vel[indices[hit], axis] *= -1
+
+
+class Leapfrog:
+    """
+    Kick-drift-kick leapfrog: half kick with the stored accelerations, full drift, new accelerations, half kick.
+    Second order and symplectic, with one force evaluation per step. The accelerations of the end of a step are
+    stored and start the next one.
+    """
+    name = "leapfrog"
+    stages = (1.0,) # fractions of dt taken by the leapfrog steps that make up one step
+
+    def step(self, store: "ParticleStore", indices: np.ndarray, dt: float, accelerations: Callable[[], np.ndarray],
+             section: Callable = lambda name: nullcontext()) -> None:
+        """
+        Advances the given particles by dt.
+        Args:
+            store (ParticleStore): All particles.
+            indices (np.ndarray): Rows to advance.
+            dt (float): Time step in seconds.
+            accelerations (Callable): Returns the accelerations of the rows at their current positions.
+            section (Callable): Profiler section factory.
+        """
+        pos, vel, acc = store.pos, store.vel, store.acc
+        for stage in self.stages:
+            h = stage * dt
+            with section("integrate"):
+                vel[indices] += 0.5 * h * acc[indices]
+                pos[indices] += vel[indices] * h
+                window_collisions(store, indices)
+            acc[indices] = accelerations()
+            with section("integrate"):
+                vel[indices] += 0.5 * h * acc[indices]
+
+
+class Yoshida4(Leapfrog):
+    """
+    Yoshida's 4th order scheme, written as three leapfrog steps of w1, w0 and w1 times dt.
+    Three force evaluations per step, but the error shrinks with dt**4 instead of dt**2, so it can take much larger
+    steps for the same accuracy.
+    """
+    name = "yoshida"
+    stages = (YOSHIDA_W1, YOSHIDA_W0, YOSHIDA_W1)
+
+
+INTEGRATORS = {integrator.name: integrator for integrator in (Leapfrog, Yoshida4)}
+
+
+def total_energy(store: "ParticleStore", indices: np.ndarray | None = None, chunk_size: int = 1024) -> float:
+    """
+    Kinetic plus gravitational potential energy of the given particles, with every pair summed directly
+    (softened like the forces). O(n^2), so it is meant for reports rather than every frame.
+    Args:
+        store (ParticleStore): All particles.
+        indices (np.ndarray | None): Rows to include. Every particle if None.
+        chunk_size (int): Rows summed against all others at once. Bounds the memory used.
+    Returns:
+        float: The total energy.
+    """
+    if indices is None:
+        indices = np.arange(len(store))
+    x, y, mass = store.x[indices], store.y[indices], store.mass[indices]
+    vel = store.vel[indices]
+    kinetic = 0.5 * float(np.sum(mass * np.einsum("ij,ij->i", vel, vel)))
+    potential = 0.0
+    for start in range(0, len(indices), chunk_size):
+        rows = slice(start, min(start + chunk_size, len(indices)))
+        dx = x[rows, np.newaxis] - x
+        dy = y[rows, np.newaxis] - y
+        inverse = 1 / np.sqrt(dx*dx + dy*dy + GRAVITY_SOFTENING)
+        inverse[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = 0 # no self energy
+        potential -= 0.5 * G * float(mass[rows] @ inverse @ mass) # every pair is counted twice
+    return kinetic + potential
@@ -0,0 +1,257 @@
+from settings import *
+
+
+def interleave_bits(ix: np.ndarray, iy: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Interleaves the low bits of two integer arrays into Morton (z-order) keys.
+    The y bit is the higher bit of every pair, so sorting keys orders quadrants nw, ne, sw, se like QuadTree.children.
+    Args:
+        ix, iy (np.ndarray): Integer cell coordinates.
+        bits (int): Number of bits to take from each coordinate.
+    Returns:
+        np.ndarray: Morton keys (int64).
+    """
+    ix = ix.astype(np.int64)
+    iy = iy.astype(np.int64)
+    keys = np.zeros(ix.shape, dtype=np.int64)
+    for bit in range(bits):
+        keys |= ((ix >> bit) & 1) << (2 * bit)
+        keys |= ((iy >> bit) & 1) << (2 * bit + 1)
+    return keys
+
+def deinterleave_bits(keys: np.ndarray, bits: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Inverse of interleave_bits().
+    Args:
+        keys (np.ndarray): Morton keys.
+        bits (int): Number of bits per coordinate.
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The (ix, iy) cell coordinates.
+    """
+    ix = np.zeros(keys.shape, dtype=np.int64)
+    iy = np.zeros(keys.shape, dtype=np.int64)
+    for bit in range(bits):
+        ix |= ((keys >> (2 * bit)) & 1) << bit
+        iy |= ((keys >> (2 * bit + 1)) & 1) << bit
+    return ix, iy
+
+def expand_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Concatenates the integer ranges [start, start + count) without a Python loop.
+    Args:
+        starts (np.ndarray): First value of every range.
+        counts (np.ndarray): Length of every range.
+    Returns:
+        np.ndarray: All the ranges back to back.
+    """
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(total)
+
+
+class LinearQuadTree:
+    """
+    Array-based quadtree built from Morton-sorted particles. Drop-in alternative to QuadTree for barnes-hut queries.
+    Every node is a row in a set of flat arrays (breadth-first, sorted by Morton key within a level) and owns the
+    contiguous range [start, start + count) of the sorted particles. A node is split exactly when QuadTree would split it:
+    when it holds more than `capacity` particles and is above `maxlevel`.
+    Args:
+        boundary (pygame.FRect or pygame.Rect): Bounding rectangle of the root node.
+        capacity (int): Number of particles a node can hold before it is divided.
+        maxlevel (int): The maximum level a node can be.
+    """
+    def __init__(self, boundary: pygame.FRect | pygame.Rect, capacity: int = 1, maxlevel: int = 5) -> None:
+        self.boundary = pygame.FRect(boundary)
+        self.capacity = capacity
+        self.maxlevel = maxlevel
+        self.build(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0))
+
+    def morton_keys(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Computes the Morton key of the maxlevel cell every position falls in.
+        Args:
+            x, y (np.ndarray): Positions inside the boundary.
+        Returns:
+            np.ndarray: Morton keys (int64).
+        """
+        cells = 1 << self.maxlevel
+        ix = ((x - self.boundary.left) * (cells / self.boundary.width)).astype(np.int64)
+        iy = ((y - self.boundary.top) * (cells / self.boundary.height)).astype(np.int64)
+        np.clip(ix, 0, cells - 1, out=ix)
+        np.clip(iy, 0, cells - 1, out=iy)
+        return interleave_bits(ix, iy, self.maxlevel)
+
+    def build(self, indices: np.ndarray, x: np.ndarray, y: np.ndarray, mass: np.ndarray) -> None:
+        """
+        Rebuilds the tree and every node's mass and center of mass.
+        Particles outside the boundary are left out, like QuadTree.insert() does.
+        Args:
+            indices (np.ndarray): Store rows of the particles.
+            x, y (np.ndarray): Positions of those particles.
+            mass (np.ndarray): Masses of those particles.
+        """
+        b = self.boundary
+        inside = (x >= b.left) & (x < b.right) & (y >= b.top) & (y < b.bottom)
+        if not inside.all():
+            indices, x, y, mass = indices[inside], x[inside], y[inside], mass[inside]
+
+        keys = self.morton_keys(x, y)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.order = np.asarray(indices)[order] # store rows in morton order
+        self.x = x[order]
+        self.y = y[order]
+        self.m = mass[order]
+        n = len(order)
+
+        levels, prefixes, starts, counts = [], [], [], []
+        active = np.ones(n, dtype=bool) # particles whose node at the current level exists
+        for level in range(self.maxlevel + 1):
+            rows = np.flatnonzero(active)
+            if rows.size == 0:
+                break
+            prefix = self.keys[rows] >> (2 * (self.maxlevel - level))
+            # nodes of different parents never share a prefix, so a prefix change marks every node boundary
+            first = np.ones(rows.size, dtype=bool)
+            first[1:] = prefix[1:] != prefix[:-1]
+            run_starts = np.flatnonzero(first)
+            level_counts = np.diff(np.append(run_starts, rows.size))
+            level_starts = rows[run_starts]
+
+            levels.append(np.full(run_starts.size, level, dtype=np.int64))
+            prefixes.append(prefix[run_starts])
+            starts.append(level_starts)
+            counts.append(level_counts)
+
+            split = level_counts > self.capacity if level < self.maxlevel else np.zeros(run_starts.size, dtype=bool)
+            edges = np.zeros(n + 1, dtype=np.int64)
+            np.add.at(edges, level_starts[split], 1)
+            np.add.at(edges, level_starts[split] + level_counts[split], -1)
+            active = np.cumsum(edges[:-1]) > 0
+
+        if not levels:
+            levels = prefixes = starts = counts = [np.empty(0, dtype=np.int64)]
+        self.level = np.concatenate(levels)
+        self.prefix = np.concatenate(prefixes)
+        self.start = np.concatenate(starts)
+        self.count = np.concatenate(counts)
+        self.n_nodes = len(self.level)
+
+        self.link_children(levels)
+        self.calculate_CoM()
+        self.calculate_bounds()
+
+    def link_children(self, levels: list[np.ndarray]) -> None:
+        """
+        Finds the first child and number of children of every node. Leaves have first_child = -1.
+        Args:
+            levels (list[np.ndarray]): The level arrays of every tree level, in order.
+        """
+        self.first_child = np.full(self.n_nodes, -1, dtype=np.int64)
+        self.n_children = np.zeros(self.n_nodes, dtype=np.int64)
+        level_offsets = np.cumsum([0] + [len(level) for level in levels])
+        for level in range(1, len(levels)):
+            parents = slice(level_offsets[level - 1], level_offsets[level])
+            children = np.arange(level_offsets[level], level_offsets[level + 1])
+            if children.size == 0:
+                continue
+            # a child's prefix without its last two bits is its parent's prefix
+            parent = np.searchsorted(self.prefix[parents], self.prefix[children] >> 2) + parents.start
+            new_parent = np.ones(children.size, dtype=bool)
+            new_parent[1:] = parent[1:] != parent[:-1]
+            self.first_child[parent[new_parent]] = children[new_parent]
+            self.n_children += np.bincount(parent, minlength=self.n_nodes)
+
+    def calculate_CoM(self) -> None:
+        """
+        Calculates every node's mass and center of mass with segmented sums over the sorted particles.
+        """
+        self.mass = np.zeros(self.n_nodes)
+        self.x_com = np.zeros(self.n_nodes)
+        self.y_com = np.zeros(self.n_nodes)
+        if self.n_nodes == 0:
+            self.link_sources()
+            return
+        # reduceat sums [start, end) for the even entries; the odd entries are discarded
+        bounds = np.empty(2 * self.n_nodes, dtype=np.int64)
+        bounds[0::2] = self.start
+        bounds[1::2] = self.start + self.count
+        pad = lambda values: np.append(values, 0.0)
+        self.mass = np.add.reduceat(pad(self.m), bounds)[0::2]
+        has_mass = self.mass != 0
+        mass = np.where(has_mass, self.mass, 1.0)
+        self.x_com = np.where(has_mass, np.add.reduceat(pad(self.m * self.x), bounds)[0::2] / mass, 0.0)
+        self.y_com = np.where(has_mass, np.add.reduceat(pad(self.m * self.y), bounds)[0::2] / mass, 0.0)
+        self.link_sources()
+
+    def link_sources(self) -> None:
+        """
+        Lays out the table barnes-hut interaction lists index into: every node's center of mass, then every particle,
+        so sources[n_nodes + i] is sorted particle i.
+        """
+        self.source_x = np.concatenate((self.x_com, self.x))
+        self.source_y = np.concatenate((self.y_com, self.y))
+        self.source_m = np.concatenate((self.mass, self.m))
+
+    def calculate_bounds(self) -> None:
+        """
+        Calculates every node's top-left corner and size from its Morton prefix.
+        """
+        b = self.boundary
+        cells = 1 << self.level
+        ix, iy = deinterleave_bits(self.prefix, self.maxlevel)
+        self.width = b.width / cells
+        self.height = b.height / cells
+        self.left = b.left + ix * self.width
+        self.top = b.top + iy * self.height
+        s = np.maximum(self.width, self.height)
+        self.s2 = s*s
+        # distance between a node's center of mass and its geometric center, for the "offset" opening criterion
+        self.com_offset = np.hypot(self.x_com - (self.left + self.width / 2), self.y_com - (self.top + self.height / 2))
+
+    def children_of(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        Returns the children of every given node, back to back.
+        Args:
+            nodes (np.ndarray): Node indices.
+        """
+        return expand_ranges(self.first_child[nodes], self.n_children[nodes])
+
+    def query_bh(self, x: float, y: float, theta2: float = BH_THETA**2) -> np.ndarray:
+        """
+        Queries the tree for barnes-hut pseudo-particles to approximate forces.
+        Walks the tree one level at a time, opening nodes by the same criterion as QuadTree.query_bh().
+        Args:
+            x, y (float) : The position of the particle you want to find the forces of.
+            theta2 (float): Squared opening angle.
+        Returns:
+            np.ndarray: (n, 3) array of pseudo-particles as (x, y, mass) of a node's center of mass.
+        """
+        epsilon = 1e-5
+        accepted = []
+        frontier = np.zeros(min(1, self.n_nodes), dtype=np.int64)
+        while frontier.size:
+            dx = self.x_com[frontier] - x
+            dy = self.y_com[frontier] - y
+            d2 = np.maximum(dx*dx + dy*dy, epsilon) # avoid division by zero
+            far = self.s2[frontier] < theta2 * d2
+            accepted.append(frontier[far & (self.mass[frontier] != 0)])
+            leaves = frontier[~far & (self.first_child[frontier] < 0)]
+            accepted.append(self.n_nodes + expand_ranges(self.start[leaves], self.count[leaves])) # too close to use whole
+            frontier = self.children_of(frontier[~far])
+        sources = np.concatenate(accepted) if accepted else np.empty(0, dtype=np.int64)
+        return np.column_stack((self.source_x[sources], self.source_y[sources], self.source_m[sources]))
+
+    def visualize(self, zoom: float, offset: pygame.Vector2) -> None:
+        """
+        Draws a highlight on the edges of every node.
+        Args:
+            zoom (int or float): Your camera's zoom.
+            offset (pygame.math.Vector2): Your camera's offset.
+        """
+        surface = pygame.display.get_surface()
+        for left, top, width, height in zip(self.left.tolist(), self.top.tolist(), self.width.tolist(), self.height.tolist()):
+            rect = pygame.FRect(left * zoom + offset.x, top * zoom + offset.y, width * zoom, height * zoom)
+            pygame.draw.rect(surface, "white", rect, 3)
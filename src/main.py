@@ -1,7 +1,15 @@
+import argparse
 from settings import *
 from cam import Cam
 from particle import Particle
+from simulation import Simulation
+from pipeline import Pipeline
+from snapshot import Autosaver, load_snapshot
+from trajectory import TrajectoryPlayer, TrajectoryRecorder
+from diagnostics import DiagnosticsLog
 from groups import ParticleDrawing
+from sprite_cache import sprite_cache
+from heatmap import DensityHeatmap
 from utils import *
 from hints import *
 from input import *
@@ -12,9 +20,13 @@ class Game:
     Main game class for the gravity simulation. Handles initialization,
     rendering, game loop, and event management.
     """
-    def __init__(self):
+    def __init__(self, record: str | None = None, play: str | None = None, diagnostics: str | None = None):
         """
         Initialize the game, set up display, state variables, groups, sprites, and grid.
+        Args:
+            record: trajectory file to record every physics step to.
+            play: trajectory file to play back instead of simulating.
+            diagnostics: CSV file to log conservation diagnostics to.
         """
         # setup
         pygame.init()
@@ -30,10 +42,25 @@ class Game:
         self.old_world_mouse_pos = pygame.Vector2(self.mouse.get_pos())
         self.particle_menu = None
         self.dt = self.clock.tick(FPS) / 1000
+        self.alpha = 1.0 # how far between old_pos and new_pos particles are drawn
         self.debug = False
 
+        # physics
+        self.sim = Simulation()
+        if record:
+            self.sim.recorder = TrajectoryRecorder(record)
+        if diagnostics:
+            self.sim.diagnostics = DiagnosticsLog(diagnostics)
+        self.player = TrajectoryPlayer(play) if play else None # playback mode: no physics, steps come from the file
+        self.pipeline = Pipeline(self.sim) if PIPELINED and not self.player else None
+        # the store the game reads and edits. when pipelined, a front buffer synced with the simulated one every frame
+        self.store = self.pipeline.front if self.pipeline else self.sim.store
+        self.profiler = self.sim.profiler # per-stage frame times, graphed in debug mode
+        self.autosaver = Autosaver(AUTOSAVE_PATH, AUTOSAVE_INTERVAL)
+
         # groups
         self.particles = ParticleDrawing()
+        self.heatmap = DensityHeatmap()
         self.logtext = pygame.sprite.Group()
         
         # sprites
@@ -41,10 +68,7 @@ class Game:
         self.font = pygame.font.Font(None, 20)
         self.info_particle = None
         self.dragged_particle = None
-        
-        # spatial partitioning tools (lag killers)
-        self.quadtree = QuadTree(pygame.FRect(-HALF_WORLD_WIDTH, -HALF_WORLD_HEIGHT, HALF_WORLD_WIDTH * 2, HALF_WORLD_HEIGHT * 2), 1, self.cam)
-        self.grid = SpatialGrid()
+
 
         # singleton utility objects
         self.logprinter = LogPrinter(self.font, self.logtext, self.logtext)
@@ -80,6 +104,39 @@ class Game:
             f"zoom = {truncate_decimal(self.cam.zoom, 1)}x",
             f"fps = {truncate_decimal(self.clock.get_fps(), 0)}"
         ]
+        if self.debug:
+            stats = sprite_cache.stats()
+            cam_info.append(f"sprite cache = {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+                            f"{truncate_decimal(stats['bytes'] / 1024**2, 1)} MB")
+            latest = self.sim.diagnostics.latest if self.sim.diagnostics else None
+            if latest is not None:
+                cam_info.append(f"energy = {latest['energy']:.4g}, momentum = ({latest['momentum_x']:.3g}, {latest['momentum_y']:.3g}), "
+                                f"L = {latest['angular_momentum']:.3g}")
+            if isinstance(self.sim.quadtree, QuadTree):
+                pool = self.sim.quadtree.pool.stats()
+                cam_info.append(f"node pool = {pool['nodes']} nodes (high water {pool['high_water']}, capacity {pool['capacity']}), "
+                                f"{pool['slots']} particle slots, {pool['grows']} grows")
+                if self.sim.quadtree.leaves is not None:
+                    cam_info.append(f"tree relocations = {self.sim.quadtree.relocated} / {len(self.sim.quadtree.leaves)} particles")
+            tuner = self.sim.tuner
+            if tuner is not None and tuner.error is not None:
+                cam_info.append(f"theta = {tuner.forces.theta:.3f} ({tuner.forces.opening}), force error = {tuner.error:.2e} "
+                                f"/ {tuner.target:.0e}, {tuner.interactions:.0f} interactions")
+            block_stats = self.sim.block_stats
+            if self.sim.block_timesteps and block_stats is not None:
+                cam_info += [
+                    f"block levels = {block_stats['levels'].tolist()} ({block_stats['substeps']} substeps)",
+                    f"force evals = {block_stats['evaluations']} / {block_stats['shared_evaluations']} shared dt, "
+                    f"tree builds = {block_stats['builds']}"
+                ]
+        if self.player:
+            step = self.player.index[self.player.position]
+            cam_info += [
+                "----------[PLAYBACK]----------",
+                f"step = {step['step']} ({self.player.position + 1}/{len(self.player)})",
+                f"time = {truncate_decimal(step['time'], 2)} s",
+                f"speed = {self.player.speed}x{' (paused)' if self.player.paused else ''}"
+            ]
         draw_info(cam_info, self.font, self.display_surf, "topright")
     
     def make_particles(self, num=None):
@@ -95,10 +152,37 @@ class Game:
                 randint(1, MAX_STARTING_MASS),  # mass
                 randint(1, MAX_STARTING_DENSITY),   # density
                 self.particles, # groups
-                self.particles  # particles
+                self.store      # store
             )
             Particle(*args)
     
+    def show_recorded_step(self):
+        """
+        Advances playback and loads the current recorded step into the store.
+        """
+        self.player.update(self.dt)
+        for row in self.player.show(self.store).tolist():
+            Particle.attach(self.store, row, self.particles)
+
+    def quicksave(self):
+        """
+        Saves the particles, camera and sim time to the autosave file in the background.
+        """
+        self.autosaver.save(self.store, self.sim.time, self.sim.steps, self.cam)
+
+    def quickload(self):
+        """
+        Replaces the particles, camera and sim time with the ones in the autosave file.
+        """
+        if self.pipeline:
+            self.pipeline.wait()
+        snapshot = load_snapshot(AUTOSAVE_PATH)
+        for row in self.sim.load(snapshot, self.store).tolist():
+            Particle.attach(self.store, row, self.particles)
+        if snapshot.cam:
+            self.cam.set_pos(snapshot.cam["pos"])
+            self.cam.zoom = snapshot.cam["zoom"]
+
     def draw_world_border(self):
         """
         Draw the border of the simulated world on the screen.
@@ -127,63 +211,105 @@ class Game:
         self.dragged_particle = self.input.dragged_particle
         self.particle_menu = self.input.particle_menu
 
+    def draw(self, particles: list[Particle], percentiles: np.ndarray):
+        """
+        Draws the world, the HUD and the particle creation menu for one frame.
+        Args:
+            particles: particles in render distance.
+            percentiles: color bins, used by the particle creation menu.
+        """
+        self.display_surf.fill(BG_COLOR)
+        if not self.particle_menu:
+            if self.heatmap.enabled:
+                self.heatmap.draw(self.display_surf, self.store, self.cam)
+            if self.debug:
+                self.sim.quadtree.visualize(self.cam.zoom, self.particles.offset)
+            self.particles.draw(particles, self.cam, self.alpha)
+            # Draw lines between neighboring particles [DEBUG]
+            if self.debug:
+                self.sim.rebuild_grid(np.array([particle.index for particle in particles], dtype=np.int64), self.store)
+                for particle in particles:
+                    if particle.alive():
+                        particle.draw_neighbor_lines(self.display_surf, self.cam, self.sim.grid)
+            self.draw_cam_info()
+            self.draw_world_border()
+            self.draw_particle_info()
+            self.logtext.draw(self.display_surf)
+            display_hints(self.logprinter)
+            if self.debug:
+                self.profiler.draw(self.display_surf, self.font)
+
+        self.manager.update(self.dt)
+        if self.particle_menu:
+            self.particle_menu.update(percentiles)
+            self.manager.draw_ui(self.display_surf)
+
     def run(self):
         """
         Main game loop. Handles updates, drawing, and event processing.
         """
-        self.make_particles()
+        if not self.player:
+            self.make_particles()
         frame_count = 0
         while self.on:
             frame_count += 1
             self.dt = self.clock.tick(FPS) / 1000
 
-            self.quadtree.clear()
-            self.grid.clear_grid()
-
-            percentiles = calculate_color_bins(self.particles, frame_count)
-            particles, p_not_in_render = self.cam.filter_rendered_particles(self.particles)
-            if frame_count % FRAMES_SKIPPED_FOR_FAR_PARTICLES == 0:
-                p_not_in_render = split_particles_not_in_render(p_not_in_render, len(particles))
-                particles += p_not_in_render
+            if self.pipeline:
+                with self.profiler.section("sync"):
+                    self.pipeline.swap()
+            if self.player:
+                with self.profiler.section("playback"):
+                    self.show_recorded_step()
+            with self.profiler.section("culling"):
+                percentiles = calculate_color_bins(self.store.mass, frame_count)
+                in_render, p_not_in_render = self.cam.filter_rendered_particles(self.store)
+                # handles stay valid across the compaction at the end of the physics step; row indices dont
+                particles = [self.store.handles[i] for i in in_render]
+                updated = in_render
+                if frame_count % FRAMES_SKIPPED_FOR_FAR_PARTICLES == 0:
+                    p_not_in_render = split_particles_not_in_render(p_not_in_render, len(in_render))
+                    updated = np.concatenate((in_render, p_not_in_render))
+                counter = {"e":0.0} # for debug
 
-            for particle in particles:
-                self.quadtree.insert(particle)
-                self.grid.add_particle(particle)
-            self.quadtree.calculate_CoM()
-            counter = {"e":0.0} # for debug
-
-            update_particles(particles, self.dt, self.cam, percentiles, self.grid, self.quadtree, counter)
+                self.store.update_colors(percentiles, updated)
+            if self.pipeline:
+                # debug drawing reads the simulation's tree and grid, so the step has to be done by then
+                self.pipeline.launch(self.dt, updated, counter, wait=self.debug)
+                self.alpha = self.pipeline.alpha
+            elif not self.player:
+                self.alpha = self.sim.advance(self.dt, updated, counter)
+            with self.profiler.section("render"):
+                particles = [particle for particle in particles if particle.alive() and not particle.in_menu]
+                for particle in particles:
+                    particle.update_drawing(self.cam, self.alpha)
             
-            self.logtext.update(self.dt)
-            self.input.get_input(self.dt)
-            self.event_handler()
-            self.cam.update(self.dt)
-            self.pass_in_vars()
+            with self.profiler.section("input"):
+                self.logtext.update(self.dt)
+                self.input.get_input(self.dt)
+                self.event_handler()
+                self.cam.update(self.dt)
+                self.pass_in_vars()
             
-            self.display_surf.fill(BG_COLOR)
-            if not self.particle_menu:
-                if self.debug:
-                    self.quadtree.visualize(self.cam.zoom, self.particles.offset)
-                self.particles.draw(particles, self.cam)
-                # Draw lines between neighboring particles [DEBUG]
-                if self.debug:
-                    for particle in particles:
-                        if particle.alive():
-                            particle.draw_neighbor_lines(self.display_surf, self.cam, self.grid)
-                self.draw_cam_info()
-                self.draw_world_border()
-                self.draw_particle_info()
-                self.logtext.draw(self.display_surf)
-                display_hints(self.logprinter)
-
-            self.manager.update(self.dt)
-            if self.particle_menu:
-                self.particle_menu.update(percentiles)
-                self.manager.draw_ui(self.display_surf)
-
-            pygame.display.update()
+            with self.profiler.section("render"):
+                self.draw(particles, percentiles)
+            with self.profiler.section("display"):
+                pygame.display.update()
+            with self.profiler.section("autosave"):
+                self.autosaver.update(self.store, self.sim.time, self.sim.steps, self.cam)
+            self.profiler.end_frame()
             if self.debug:
                 print(counter)
+        self.close()
+
+    def close(self):
+        """
+        Finishes the physics step and save in flight, then stops the workers and flushes the recorder and diagnostics.
+        """
+        if self.pipeline:
+            self.pipeline.close()
+        self.autosaver.close()
+        self.sim.close()
             
     def event_handler(self):
         """
@@ -191,6 +317,7 @@ class Game:
         """
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                self.close()
                 pygame.quit()
                 sys.exit()
                 
@@ -226,5 +353,10 @@ class Game:
                 self.manager.set_window_resolution((event.w, event.h))
 
 if __name__ == '__main__':
-    game = Game()
+    parser = argparse.ArgumentParser(description="Gravity simulation.")
+    parser.add_argument("--record", metavar="TRAJECTORY", help="record every physics step to this file")
+    parser.add_argument("--play", metavar="TRAJECTORY", help="play back a recorded run instead of simulating")
+    parser.add_argument("--diagnostics", metavar="CSV", help="log momentum, angular momentum and energy every DIAGNOSTICS_EVERY steps")
+    args = parser.parse_args()
+    game = Game(args.record, args.play, args.diagnostics)
     game.run()
\ No newline at end of file
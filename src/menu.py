@@ -1,6 +1,8 @@
 from settings import *
 from particle import *
 from utils import *
+if TYPE_CHECKING:
+    from store import ParticleStore
 
 
 class ParticleCreationMenu:
@@ -9,14 +11,14 @@ class ParticleCreationMenu:
     Handles UI elements, input validation, and particle preview.
     """
     def __init__(self, font: pygame.Font, ui_manager: object, 
-                 groups: Sequence[pygame.sprite.Group], particles: pygame.sprite.Group) -> None:
+                 groups: Sequence[pygame.sprite.Group], store: "ParticleStore") -> None:
         """
         Initialize the particle creation menu and its UI elements.
         Args:
             font: Font used for labels and input boxes.
             ui_manager: pygame_gui UI manager.
             groups: Sprite groups for the menu particle.
-            particles: Particle group for simulation.
+            store: Store that holds every particle's state.
             display: Surface to draw the menu on.
         """
         self.display = pygame.display.get_surface()
@@ -69,7 +71,7 @@ class ParticleCreationMenu:
             input_box.set_text(str(self.default_values[i]))
             self.input_boxes.append(input_box)
 
-        self.menu_particle = Particle(mid_screen_width, mid_screen_height, 0, 0, self.default_mass, self.default_density, groups, particles)
+        self.menu_particle = Particle(mid_screen_width, mid_screen_height, 0, 0, self.default_mass, self.default_density, groups, store)
         self.menu_particle.in_menu = True
 
     def update_points(self) -> None:
@@ -0,0 +1,153 @@
+import atexit
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+from types import SimpleNamespace
+from settings import *
+from linear_tree import LinearQuadTree
+from barnes_hut import BarnesHutForces
+
+TREE_FLOATS = ("s2", "com_offset") # per-node LinearQuadTree arrays the force walk reads
+TREE_INTS = ("first_child", "n_children", "start", "count")
+TREE_SOURCES = ("source_x", "source_y", "source_m") # node centers of mass then particles, see LinearQuadTree.link_sources()
+
+# worker process state
+_attached: dict[str, shared_memory.SharedMemory] = {}
+_worker_forces = None
+
+
+class SharedBlock:
+    """
+    A growable shared-memory array owned by the main process. Growing replaces the block with a bigger one under a new name.
+    Args:
+        dtype: Element type.
+    """
+    def __init__(self, dtype) -> None:
+        self.dtype = np.dtype(dtype)
+        self.shm = None
+        self.capacity = 0
+
+    def view(self, size: int) -> np.ndarray:
+        """
+        Returns the first `size` elements of the block, growing it (geometrically) if it is too small.
+        Args:
+            size (int): Number of elements needed.
+        """
+        if size > self.capacity:
+            self.close()
+            self.capacity = max(size, 2 * self.capacity, 1024)
+            self.shm = shared_memory.SharedMemory(create=True, size=self.capacity * self.dtype.itemsize)
+        return np.ndarray((size,), dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self) -> None:
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def _attach(name: str, dtype: str, shape: tuple) -> np.ndarray:
+    """
+    Maps a shared block into a worker, reusing the mapping across steps until the block is replaced.
+    """
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _compute_range(task: tuple) -> None:
+    """
+    Worker entry point: computes the accelerations of rows [start, stop) straight into the shared output block.
+    Only block names, sizes and the row range are sent per step; the arrays themselves are never pickled.
+    """
+    global _worker_forces
+    layout, n, n_nodes, n_sources, theta, opening, start, stop = task
+    if _worker_forces is None:
+        _worker_forces = BarnesHutForces()
+    _worker_forces.theta, _worker_forces.opening = theta, opening
+    for name in [name for name in _attached if name not in layout.values()]: # blocks the main process replaced
+        _attached.pop(name).close()
+    floats = _attach(layout["tree_floats"], "float64", (len(TREE_FLOATS), n_nodes))
+    ints = _attach(layout["tree_ints"], "int64", (len(TREE_INTS), n_nodes))
+    sources = dict(zip(TREE_SOURCES, _attach(layout["tree_sources"], "float64", (len(TREE_SOURCES), n_sources))))
+    tree = SimpleNamespace(n_nodes=n_nodes, x_com=sources["source_x"][:n_nodes], y_com=sources["source_y"][:n_nodes],
+                           mass=sources["source_m"][:n_nodes], **sources, **dict(zip(TREE_FLOATS, floats)), **dict(zip(TREE_INTS, ints)))
+    pos = _attach(layout["pos"], "float64", (4, n))
+    out = _attach(layout["out"], "float64", (n, 2))
+    out[start:stop] = _worker_forces.accelerations(tree, pos[0, start:stop], pos[1, start:stop], pos[2:, start:stop].T)
+
+
+class ParallelForces:
+    """
+    Barnes-hut forces computed by a persistent process pool over shared memory.
+    Every step the particle positions and the flattened tree are copied into shared blocks; each worker walks the tree
+    for a disjoint range of particles and writes its accelerations straight into a shared output array.
+    Args:
+        workers (int): Number of worker processes.
+        chunks_per_worker (int): Row ranges per worker, for load balancing.
+        theta (float): Opening angle, can be changed between calls.
+        opening (str): Opening criterion, see BarnesHutForces.far().
+    """
+    def __init__(self, workers: int, chunks_per_worker: int = 2, theta: float = BH_THETA, opening: str = BH_OPENING) -> None:
+        self.workers = workers
+        self.chunks = workers * chunks_per_worker
+        # workers must share our tracker, or theirs would unlink the blocks they attach when the pool stops
+        resource_tracker.ensure_running()
+        self.pool = multiprocessing.get_context().Pool(workers)
+        self.theta = theta
+        self.opening = opening
+        self.blocks = {
+            "tree_floats": SharedBlock(np.float64),
+            "tree_ints": SharedBlock(np.int64),
+            "tree_sources": SharedBlock(np.float64),
+            "pos": SharedBlock(np.float64),
+            "out": SharedBlock(np.float64),
+        }
+        atexit.register(self.close)
+
+    def accelerations(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray, previous: np.ndarray | None = None) -> np.ndarray:
+        """
+        Calculates the barnes-hut acceleration of every particle. Same results as BarnesHutForces.accelerations().
+        Args:
+            tree (LinearQuadTree): A built tree.
+            x, y (np.ndarray): Positions of the particles.
+            previous (np.ndarray | None): (n, 2) last accelerations of the particles, used by the "relative" criterion.
+        Returns:
+            np.ndarray: (n, 2) accelerations.
+        """
+        n, n_nodes, n_sources = len(x), tree.n_nodes, len(tree.source_x)
+        floats = self.blocks["tree_floats"].view(len(TREE_FLOATS) * n_nodes).reshape(len(TREE_FLOATS), n_nodes)
+        for row, name in zip(floats, TREE_FLOATS):
+            row[:] = getattr(tree, name)
+        ints = self.blocks["tree_ints"].view(len(TREE_INTS) * n_nodes).reshape(len(TREE_INTS), n_nodes)
+        for row, name in zip(ints, TREE_INTS):
+            row[:] = getattr(tree, name)
+        sources = self.blocks["tree_sources"].view(len(TREE_SOURCES) * n_sources).reshape(len(TREE_SOURCES), n_sources)
+        for row, name in zip(sources, TREE_SOURCES):
+            row[:] = getattr(tree, name)
+        pos = self.blocks["pos"].view(4 * n).reshape(4, n) # x, y and the last acceleration
+        pos[0], pos[1] = x, y
+        pos[2:] = previous.T if previous is not None else 0.0
+        out = self.blocks["out"].view(2 * n).reshape(n, 2)
+
+        layout = {name: block.name for name, block in self.blocks.items()}
+        bounds = np.linspace(0, n, self.chunks + 1).astype(int)
+        tasks = [(layout, n, n_nodes, n_sources, self.theta, self.opening, start, stop)
+                 for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        self.pool.map(_compute_range, tasks)
+        return out.copy()
+
+    def close(self) -> None:
+        """
+        Stops the workers and frees the shared blocks.
+        """
+        if self.pool is None:
+            return
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+        for block in self.blocks.values():
+            block.close()
@@ -0,0 +1,63 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from settings import *
+from simulation import Simulation
+from store import ParticleStore
+
+
+class Pipeline:
+    """
+    Double-buffered physics: a worker thread steps the simulation's store (the back buffer) while the game renders
+    and edits its own copy (the front buffer). The two are synced at swap(), once per frame, so a frame takes about
+    max(physics, render) instead of their sum. The rendered state is one step behind the simulated one.
+    Input edits to the front store are recorded as commands and replayed onto the back store at the swap.
+    The physics stages keep timing into the simulation's profiler, so its sections overlap the render ones.
+    Args:
+        sim (Simulation): The simulation to step. Its store becomes the back buffer.
+    """
+    def __init__(self, sim: Simulation) -> None:
+        self.sim = sim
+        self.front = ParticleStore()
+        self.front.commands = []
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="physics")
+        self.pending: Future | None = None
+        self.alpha = 1.0 # interpolation factor of the front store, see Simulation.advance()
+
+    def swap(self) -> None:
+        """
+        Waits for the step in flight, replays the front store's recorded edits onto the back store, then copies the
+        back store into the front one.
+        """
+        self.wait()
+        back = self.sim.store
+        back.replay(self.front.commands, self.front)
+        self.front.commands.clear()
+        self.front.mirror(back)
+
+    def wait(self) -> None:
+        """
+        Waits for the step in flight, if any. The simulation can be touched from this thread afterwards.
+        """
+        if self.pending is not None:
+            self.alpha = self.pending.result()
+            self.pending = None
+
+    def launch(self, dt: float, indices: np.ndarray, counter: dict | None = None, wait: bool = False) -> None:
+        """
+        Starts advancing the back store by one frame on the worker thread. Must be called right after swap(), while the
+        front and back rows still line up.
+        Args:
+            dt (float): Time since the last frame in seconds.
+            indices (np.ndarray): Rows to update.
+            counter (dict | None): Debug counters.
+            wait (bool): Finish the step before returning, for code that reads the simulation's tree or grid.
+        """
+        self.pending = self.worker.submit(self.sim.advance, dt, indices, counter)
+        if wait:
+            self.pending.result()
+
+    def close(self) -> None:
+        """
+        Finishes the step in flight and stops the worker thread.
+        """
+        self.worker.shutdown()
+        self.pending = None
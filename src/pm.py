@@ -0,0 +1,188 @@
+"""
+Particle-mesh gravity: mass is deposited on a grid over the world and convolved with the force kernel by FFT.
+
+The force law is G * m / r^2 in the plane, whose Green's function is not the 2D Poisson one, so the mesh is convolved
+with that force kernel directly instead of solving Poisson's equation in k-space. The grid is zero-padded to twice its
+size, so the world is isolated rather than periodic.
+
+The kernel is split like in P3M / TreePM codes: the mesh carries the long-range part, smoothed on the scale
+r_s = 1.25 grid cells, and the optional short-range part is summed directly over the pairs closer than 4.5 r_s.
+Without it, forces between particles a few cells apart are smoothed away. The grid is refined as the particle count
+grows, so the pairs within the cutoff of every particle stay about the same and the pair sum stays O(n).
+"""
+from settings import *
+from linear_tree import LinearQuadTree, expand_ranges
+
+SPLIT_SCALE = 1.25 # r_s in grid cells
+SHORT_RANGE_CUTOFF = 4.5 # in r_s; the short-range force is below 1e-4 of the full force past it
+
+
+def erfc(x: np.ndarray) -> np.ndarray:
+    """
+    Complementary error function for x >= 0 (Abramowitz & Stegun 7.1.26, absolute error below 1.5e-7).
+    """
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return poly * np.exp(-x * x)
+
+def short_range_factor(r: np.ndarray, r_s: float) -> np.ndarray:
+    """
+    Fraction of the G * m / r^2 force at distance r that is short-range.
+    """
+    return erfc(r / (2 * r_s)) + r / (r_s * math.sqrt(math.pi)) * np.exp(-r * r / (4 * r_s * r_s))
+
+
+class ParticleMeshForces:
+    """
+    Particle-mesh force evaluation: cloud-in-cell deposit, FFT convolution with the long-range force kernel,
+    cloud-in-cell interpolation back to the particles, plus the short-range pair sum. Without the pair sum the mesh
+    smooths away the forces between near neighbors, so it is only a rough far-field estimate.
+    Takes the same (tree, x, y) as BarnesHutForces.accelerations() and uses the tree's particles as the sources.
+    Args:
+        cells (int): Grid cells per side, at least. See grid().
+        short_range (bool): Add the direct short-range correction.
+        chunk_size (int): Max particles whose short-range pairs are summed at once.
+        max_cells (int): Grid cells per side, at most.
+        cell_particles (float): Mean particles per cell the grid is refined down to.
+    """
+    def __init__(self, cells: int = PM_GRID, short_range: bool = PM_SHORT_RANGE, chunk_size: int = 2048,
+                 max_cells: int = PM_MAX_GRID, cell_particles: float = PM_CELL_PARTICLES) -> None:
+        self.cells = cells
+        self.short_range = short_range
+        self.chunk_size = chunk_size
+        self.max_cells = max_cells
+        self.cell_particles = cell_particles
+        self._kernels: dict[tuple, tuple] = {}
+
+    def grid(self, n_sources: int) -> int:
+        """
+        Returns the grid cells per side for a number of sources: `cells`, doubled while the mean particles per cell is
+        above `cell_particles`, up to `max_cells`. The short-range cutoff is a fixed number of cells, so this keeps the
+        pairs per particle about constant. Without the short-range sum the grid is never refined.
+        Args:
+            n_sources (int): Number of source particles.
+        """
+        n = self.cells
+        while self.short_range and n < self.max_cells and n_sources > self.cell_particles * n * n:
+            n *= 2
+        return n
+
+    def kernels(self, boundary: pygame.FRect, n: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (cached) FFTs of the long-range x and y acceleration kernels, per unit mass, over every cell
+        offset of the padded grid.
+        Args:
+            boundary (pygame.FRect): Area the grid covers.
+            n (int): Grid cells per side.
+        """
+        key = (boundary.width, boundary.height, n)
+        if key not in self._kernels:
+            hx, hy = boundary.width / n, boundary.height / n
+            r_s = SPLIT_SCALE * max(hx, hy)
+            offset = np.fft.fftfreq(2 * n, 1 / (2 * n)) # 0, 1, ..., n - 1, -n, ..., -1
+            dx = offset[:, np.newaxis] * hx
+            dy = offset[np.newaxis, :] * hy
+            r = np.sqrt(dx*dx + dy*dy)
+            r[0, 0] = 1.0 # the zero offset exerts no force, whatever its factor
+            # acceleration of a target at offset (dx, dy) from a unit mass, long-range part only
+            w = -G * (1 - short_range_factor(r, r_s)) / (r * r * r)
+            w[0, 0] = 0.0
+            self._kernels[key] = (np.fft.rfft2(dx * w), np.fft.rfft2(dy * w))
+        return self._kernels[key]
+
+    def cloud_in_cell(self, boundary: pygame.FRect, x: np.ndarray, y: np.ndarray, n: int) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """
+        Returns the 4 grid cells every position is shared between and its weight in each.
+        Args:
+            boundary (pygame.FRect): Area the grid covers.
+            x, y (np.ndarray): Positions.
+            n (int): Grid cells per side.
+        Returns:
+            tuple:
+                - cells (list[np.ndarray]): 4 arrays of flat cell indices.
+                - weights (list[np.ndarray]): 4 arrays of weights, summing to 1 for every position.
+        """
+        u = (x - boundary.left) * (n / boundary.width) - 0.5 # in cells, from the first cell's center
+        v = (y - boundary.top) * (n / boundary.height) - 0.5
+        i, j = np.floor(u).astype(np.int64), np.floor(v).astype(np.int64)
+        fu, fv = u - i, v - j
+        cells, weights = [], []
+        for di, wu in ((0, 1 - fu), (1, fu)):
+            for dj, wv in ((0, 1 - fv), (1, fv)):
+                cells.append(np.clip(i + di, 0, n - 1) * n + np.clip(j + dj, 0, n - 1))
+                weights.append(wu * wv)
+        return cells, weights
+
+    def accelerations(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Calculates the acceleration of every particle.
+        Args:
+            tree (LinearQuadTree): A built tree, whose particles are the sources.
+            x, y (np.ndarray): Positions of the particles.
+        Returns:
+            np.ndarray: (n, 2) accelerations.
+        """
+        acc = np.zeros((len(x), 2))
+        if len(x) == 0 or len(tree.x) == 0:
+            return acc
+        n = self.grid(len(tree.x))
+        bounds = tree.boundary
+        kernel_x, kernel_y = self.kernels(bounds, n)
+
+        cells, weights = self.cloud_in_cell(bounds, tree.x, tree.y, n)
+        density = sum(np.bincount(c, weights=w * tree.m, minlength=n * n) for c, w in zip(cells, weights))
+        padded = np.zeros((2 * n, 2 * n))
+        padded[:n, :n] = density.reshape(n, n)
+        density_k = np.fft.rfft2(padded)
+        field_x = np.fft.irfft2(density_k * kernel_x, padded.shape)[:n, :n].ravel()
+        field_y = np.fft.irfft2(density_k * kernel_y, padded.shape)[:n, :n].ravel()
+
+        cells, weights = self.cloud_in_cell(bounds, x, y, n)
+        for c, w in zip(cells, weights):
+            acc[:, 0] += w * field_x[c]
+            acc[:, 1] += w * field_y[c]
+        if self.short_range:
+            self.add_short_range(tree, x, y, acc, n)
+        return acc
+
+    def add_short_range(self, tree: LinearQuadTree, x: np.ndarray, y: np.ndarray, acc: np.ndarray, cells: int) -> None:
+        """
+        Adds the short-range force of every source closer than the cutoff, found through a grid of cutoff-sized
+        cells.
+        Args:
+            tree (LinearQuadTree): A built tree, whose particles are the sources.
+            x, y (np.ndarray): Positions of the particles.
+            acc (np.ndarray): (n, 2) accelerations to add to.
+            cells (int): Grid cells per side of the mesh, which sets the cutoff.
+        """
+        bounds = tree.boundary
+        r_s = SPLIT_SCALE * max(bounds.width, bounds.height) / cells
+        cutoff = SHORT_RANGE_CUTOFF * r_s
+        nx, ny = max(int(bounds.width // cutoff), 1), max(int(bounds.height // cutoff), 1)
+        cell_of = lambda px, py: (np.clip(((px - bounds.left) * (nx / bounds.width)).astype(np.int64), 0, nx - 1),
+                                  np.clip(((py - bounds.top) * (ny / bounds.height)).astype(np.int64), 0, ny - 1))
+        sx, sy = cell_of(tree.x, tree.y)
+        order = np.argsort(sx * ny + sy, kind="stable")
+        source_x, source_y, source_m = tree.x[order], tree.y[order], tree.m[order]
+        count = np.bincount(sx * ny + sy, minlength=nx * ny).reshape(nx, ny)
+        start = (np.cumsum(count.ravel()) - count.ravel()).reshape(nx, ny)
+
+        ix, iy = cell_of(x, y)
+        neighbors = np.array([(ox, oy) for ox in (-1, 0, 1) for oy in (-1, 0, 1)])
+        for first in range(0, len(x), self.chunk_size):
+            chunk = slice(first, min(first + self.chunk_size, len(x)))
+            cx = ix[chunk, np.newaxis] + neighbors[:, 0]
+            cy = iy[chunk, np.newaxis] + neighbors[:, 1]
+            inside = (cx >= 0) & (cx < nx) & (cy >= 0) & (cy < ny)
+            cx, cy = np.clip(cx, 0, nx - 1), np.clip(cy, 0, ny - 1)
+            counts = np.where(inside, count[cx, cy], 0)
+            sources = expand_ranges(start[cx, cy].ravel(), counts.ravel())
+            owner = np.repeat(np.arange(chunk.stop - chunk.start), counts.sum(axis=1))
+            dx = source_x[sources] - x[chunk][owner]
+            dy = source_y[sources] - y[chunk][owner]
+            r2 = dx*dx + dy*dy
+            r = np.sqrt(r2)
+            softened = r2 + GRAVITY_SOFTENING
+            w = np.where(r < cutoff, G * source_m[sources] * short_range_factor(r, r_s) / (softened * np.sqrt(softened)), 0.0)
+            acc[chunk, 0] += np.bincount(owner, weights=dx * w, minlength=chunk.stop - chunk.start)
+            acc[chunk, 1] += np.bincount(owner, weights=dy * w, minlength=chunk.stop - chunk.start)
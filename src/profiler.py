@@ -0,0 +1,128 @@
+from settings import *
+
+PROFILER_COLORS = [
+    (5, 209, 255), (255, 55, 197), (107, 213, 80), (255, 196, 0),
+    (190, 139, 255), (255, 110, 64), (0, 200, 170), (230, 230, 230),
+    (255, 0, 0), (53, 120, 255), (200, 255, 120), (150, 100, 60),
+]
+
+
+class _Section:
+    """Context manager that adds the time spent inside it to a profiler section."""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "FrameProfiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc) -> None:
+        current = self.profiler.current
+        current[self.name] = current.get(self.name, 0) + time.perf_counter_ns() - self.start
+
+
+class FrameProfiler:
+    """
+    Times each stage of the frame loop with perf_counter_ns and keeps the last `history` frames in a ring buffer,
+    for rolling percentiles and a stacked frame-time graph.
+    Args:
+        history (int): Number of frames kept.
+        max_sections (int): Max number of distinct section names.
+    """
+    def __init__(self, history: int = 240, max_sections: int = len(PROFILER_COLORS)) -> None:
+        self.names: list[str] = []
+        self.current: dict[str, int] = {} # ns spent in each section this frame
+        self.samples = np.zeros((history, max_sections)) # ms, one row per frame
+        self.frame = 0
+
+    def section(self, name: str) -> _Section:
+        """
+        Returns a context manager that times the code inside it as part of section `name`.
+        Time from several uses of the same name in one frame is summed.
+        Args:
+            name (str): Section name.
+        """
+        return _Section(self, name)
+
+    def end_frame(self) -> None:
+        """
+        Pushes this frame's section times into the ring buffer and starts a new frame.
+        """
+        row = self.samples[self.frame % len(self.samples)]
+        row[:] = 0
+        current, self.current = self.current, {} # swapped, not cleared, so a physics thread can keep timing into the new frame
+        for name, ns in current.items():
+            if name not in self.names:
+                if len(self.names) == self.samples.shape[1]:
+                    continue
+                self.names.append(name)
+            row[self.names.index(name)] = ns / 1e6
+        self.frame += 1
+
+    def recent(self) -> np.ndarray:
+        """
+        Returns the recorded frames, oldest first, as a (frames, sections) array in ms.
+        """
+        n = min(self.frame, len(self.samples))
+        start = self.frame % len(self.samples) if self.frame >= len(self.samples) else 0
+        return np.roll(self.samples, -start, axis=0)[:n, :len(self.names)]
+
+    def percentiles(self) -> dict[str, tuple[float, float, float]]:
+        """
+        Calculates the p50, p95 and p99 time of every section and of the whole frame over the recorded frames.
+        Returns:
+            dict: name -> (p50, p95, p99) in ms. The whole frame is under "frame".
+        """
+        samples = self.recent()
+        if samples.size == 0:
+            return {}
+        columns = {name: samples[:, i] for i, name in enumerate(self.names)}
+        columns["frame"] = samples.sum(axis=1)
+        return {name: tuple(np.percentile(values, (50, 95, 99))) for name, values in columns.items()}
+
+    def draw(self, surface: pygame.Surface, font: pygame.Font, width: int = 240, height: int = 100) -> None:
+        """
+        Draws a stacked frame-time graph with a p50/p95/p99 legend in the bottom-right corner.
+        The horizontal line marks the 1 / FPS frame budget.
+        Args:
+            surface (pygame.Surface): Surface to draw on.
+            font (pygame.Font): Font for the legend.
+            width (int): Graph width in pixels (one pixel column per frame).
+            height (int): Graph height in pixels.
+        """
+        samples = self.recent()[-width:]
+        stats = self.percentiles()
+        if not stats:
+            return
+        padding = 4
+        budget = 1000 / FPS
+        scale = height / max(2 * budget, stats["frame"][2]) # px per ms
+
+        lines = [f"{name:<10} p50 {p50:5.1f}  p95 {p95:5.1f}  p99 {p99:5.1f} ms" for name, (p50, p95, p99) in stats.items()]
+        text_height = font.get_linesize()
+        panel = pygame.Surface((max(width, max(font.size(line)[0] for line in lines) + 12) + padding * 2,
+                                height + text_height * len(lines) + padding * 3), pygame.SRCALPHA)
+        panel.fill(INFO_RECT_COLOR)
+
+        graph_bottom = padding + height
+        for x, frame in enumerate(samples):
+            y = graph_bottom
+            for i, ms in enumerate(frame):
+                bar = ms * scale
+                if bar >= 0.5:
+                    pygame.draw.line(panel, PROFILER_COLORS[i], (padding + x, y), (padding + x, y - bar))
+                y -= bar
+        budget_y = graph_bottom - budget * scale
+        pygame.draw.line(panel, "white", (padding, budget_y), (padding + width, budget_y))
+
+        y = graph_bottom + padding
+        for i, line in enumerate(lines):
+            color = PROFILER_COLORS[i] if i < len(self.names) else "white"
+            pygame.draw.rect(panel, color, (padding, y + text_height // 4, 8, 8))
+            panel.blit(font.render(line, True, "white"), (padding + 12, y))
+            y += text_height
+
+        win_w, win_h = surface.get_size()
+        surface.blit(panel, (win_w - panel.get_width() - 10, win_h - panel.get_height() - 10))
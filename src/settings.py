@@ -19,7 +19,34 @@ FRAMES_SKIPPED_FOR_FAR_PARTICLES = 1
 MAX_PARTICLE_UPDATES = NUM_PARTICLES # max num particles updated in a single frame
 MIN_RENDER_DISTANCE = 1920
 
+QUADTREE_ENGINE = "linear" # "object" (QuadTree, recursive nodes) or "linear" (LinearQuadTree, morton-sorted arrays)
+QUADTREE_INCREMENTAL = False # keep the object quadtree between rebuilds and only move the particles that left their leaf, see QuadTree.refit
+GRAVITY_SOLVER = "barnes_hut" # "barnes_hut" (BarnesHutForces / ParallelForces), "fmm" (FMMForces), "pm" (ParticleMeshForces) or "direct" (DirectForces, exact). fmm, pm and direct need the linear tree
+DIRECT_SUM_BELOW = 512 # with fewer particles than this, gravity is summed pair by pair whatever the solver (0 = never). needs the linear tree
+DIRECT_TILE = 256 # targets and sources per tile of the direct sum. bounds its memory; larger tiles fall out of cache
+FMM_ORDER = 4 # order of the fast multipole expansions
+FMM_LEAF_SIZE = 8 # particles per leaf the fast multipole tree depth is picked for
+PM_GRID = 256 # particle-mesh cells per side of the world, at least
+PM_MAX_GRID = 2048 # the particle-mesh grid is doubled up to this many cells per side...
+PM_CELL_PARTICLES = 0.5 # ...while its cells hold more particles than this on average, so the short-range pairs stay O(n)
+PM_SHORT_RANGE = True # add the direct sum over close pairs to the smoothed particle-mesh forces. off drops the forces between particles closer than a few cells
+BH_THETA = 0.75 # barnes-hut opening angle: nodes smaller than theta times their distance are used whole
+BH_OPENING = "geometric" # "geometric" (s / d < theta), "offset" (also counts how far the center of mass is off the node center) or "relative" (weights the test by the node's share of the particle's last acceleration, so it takes a smaller theta, about 0.1)
+BH_AUTOTUNE = False # adjust theta every step to keep the sampled force error at BH_TARGET_ERROR, see ThetaTuner. needs the linear tree
+BH_TARGET_ERROR = 0.01 # median relative barnes-hut force error the auto-tuner aims for
+BH_TUNER_SAMPLES = 32 # particles per step whose barnes-hut force the auto-tuner checks against a direct sum
+BATCHED_FORCES = True # walk the linear quadtree for all particles at once instead of one query_bh per particle
+PIPELINED = False # step physics on a worker thread while the previous step renders, see Pipeline
+FORCE_WORKERS = 0 # > 1 computes batched forces in a process pool over shared memory
+BATCHED_COLLISIONS = True # sort-based broadphase + union-find merges instead of per-particle SpatialGrid lookups
+
+AUTOSAVE_PATH = "autosave.snap" # also the quicksave (F5) / quickload (F9) file
+AUTOSAVE_INTERVAL = 0 # seconds between autosaves of the game to AUTOSAVE_PATH, 0 = off
+HEADLESS_AUTOSAVE_INTERVAL = 120 # default seconds between the snapshots of a headless run given --autosave
+DIAGNOSTICS_EVERY = 10 # steps between conservation diagnostics, when they are logged (--diagnostics)
+
 G = 100
+GRAVITY_SOFTENING = 1e-5 # added to the squared distance of every gravity interaction
 
 MIN_RADIUS, MAX_RADIUS = 2, 249
 MAX_STARTING_VELOCITY = 1000
@@ -29,6 +56,21 @@ PARTICLE_SPEED_AFTER_DRAGGING = 50
 PARTICLE_SPEED_AFTER_DRAGGING_UNCHANGED = True # determines if "PARTICLE_SPEED_AFTER_DRAGGING" is actually used (true if unused, false if used)
 
 FPS = 60
+HEATMAP = False # draw a mass density heatmap of every particle under the sprites (toggled with H)
+HEATMAP_CELL = 4 # screen pixels per heatmap cell
+HEATMAP_EVERY = 5 # frames between heatmap rebuilds while the camera is still
+HEATMAP_COLORS = [(0, 0, 0), (45, 20, 100), (150, 40, 110), (235, 95, 60), (255, 210, 90), (255, 255, 230)]
+LOD_RADIUS = 3 # particles with a smaller on-screen radius (px) are splatted as points instead of drawn as sprites, 0 = off
+SPRITE_CACHE_BYTES = 64 * 1024**2 # memory budget of the prescaled particle surfaces
+SPRITE_CACHE_ZOOM_STEP = 0.01 # zoom levels closer than this (relative) share cached surfaces
+FIXED_TIMESTEP = False # step physics in fixed PHYSICS_DT increments and interpolate the rendered positions
+PHYSICS_DT = 1 / 60
+MAX_PHYSICS_STEPS = 4 # per frame. time past this is dropped so a slow frame can't snowball
+INTEGRATOR = "leapfrog" # "leapfrog" (kick-drift-kick, 1 force evaluation per step) or "yoshida" (4th order, 3 per step)
+BLOCK_TIMESTEPS = False # give every particle its own power-of-two fraction of the step, see update_particles_blocks
+BLOCK_MAX_LEVEL = 5 # deepest block level, so the smallest step is dt / 2**BLOCK_MAX_LEVEL
+BLOCK_ETA = 0.05 # accuracy of the block timestep criterion, smaller means smaller steps
+BLOCK_DIRECT_BELOW = 24 # block substeps with fewer particles to kick sum their forces directly instead of building the tree
 
 INFO_RECT_PADDING = 5
 INFO_RECT_COLOR = (16, 17, 18, 200)
@@ -43,4 +85,18 @@ HIGHLIGHT_COLOR = "#6BFD11"
 BORDER_COLOR = (240, 240, 240)
 INPUT_BOX_LENGTH = 50
 
-MAX_LOG_TEXT_CHAR_WIDTH = 150
\ No newline at end of file
+MAX_LOG_TEXT_CHAR_WIDTH = 150
+
+# colors of the mass percentile bins, lightest to heaviest
+PARTICLE_COLORS = [
+    (5, 209, 255), (53, 197, 255), (107, 183, 255),
+    (146, 167, 255), (190, 139, 255), (234, 102, 243),
+    (255, 55, 197), (255, 46, 143), (255, 11, 88), (255, 0, 0)
+]
+
+# bit flags stored per particle in ParticleStore.flags
+DRAGGED = 1
+IN_MENU = 2
+INFO = 4
+DEAD = 8
+NEEDS_FORCES = 16 # acc is not from a force evaluation yet (new or loaded rows), see Simulation.step
\ No newline at end of file
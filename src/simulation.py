@@ -0,0 +1,175 @@
+from settings import *
+from utils import *
+from store import ParticleStore
+from snapshot import Snapshot
+from tuning import ThetaTuner
+
+
+class Simulation:
+    """
+    The physics world: every particle plus the quadtree and grid used to step them.
+    Needs no display, sprites or clock, so it can be driven by the Game or by a headless runner.
+    Args:
+        store (ParticleStore | None): Store to simulate. A new empty one is made if None.
+        workers (int): Force worker processes. Forces are computed in this process if <= 1.
+        integrator (str): Name of the integration scheme, a key of INTEGRATORS.
+        solver (str): "barnes_hut", "fmm", "pm" or "direct". The fast multipole, particle-mesh and direct-sum solvers always run
+            in this process.
+    """
+    def __init__(self, store: ParticleStore | None = None, workers: int = FORCE_WORKERS, integrator: str = INTEGRATOR,
+                 solver: str = GRAVITY_SOLVER) -> None:
+        self.store = store if store is not None else ParticleStore()
+        self.time = 0.0
+        self.steps = 0
+        self.accumulator = 0.0 # frame time not yet simulated, in FIXED_TIMESTEP mode
+        self.recorder = None # TrajectoryRecorder that gets every step, if any
+        self.diagnostics = None # DiagnosticsLog that measures every few steps, if any
+        self.integrator = INTEGRATORS[integrator]()
+        self.block_timesteps = BLOCK_TIMESTEPS
+        self.block_stats = None # stats of the last block timestep step, see update_particles_blocks
+        self.profiler = FrameProfiler()
+
+        # spatial partitioning tools (lag killers)
+        world_rect = pygame.FRect(-HALF_WORLD_WIDTH, -HALF_WORLD_HEIGHT, HALF_WORLD_WIDTH * 2, HALF_WORLD_HEIGHT * 2)
+        if QUADTREE_ENGINE == "linear":
+            self.quadtree = LinearQuadTree(world_rect, 1)
+        else:
+            self.quadtree = QuadTree(world_rect, 1, None)
+        self.grid = SpatialGrid()
+        if solver == "fmm":
+            self.forces = FMMForces()
+        elif solver == "pm":
+            self.forces = ParticleMeshForces()
+        elif solver == "direct":
+            self.forces = DirectForces()
+        else:
+            self.forces = ParallelForces(workers) if workers > 1 else BarnesHutForces()
+        # ThetaTuner that adjusts the barnes-hut theta after every step, if any. It needs the linear tree
+        self.tuner = ThetaTuner(self.forces) if BH_AUTOTUNE and solver == "barnes_hut" else None
+
+    def make_particles(self, num: int, rng: np.random.Generator) -> None:
+        """
+        Adds randomly generated particles to the store, without sprite handles.
+        Uses the same ranges as Game.make_particles().
+        Args:
+            num (int): Number of particles to make.
+            rng (np.random.Generator): Seeded generator, so runs are reproducible.
+        """
+        sign = lambda: rng.choice([-1, 1], num)
+        xs = rng.integers(-HALF_WORLD_WIDTH, HALF_WORLD_WIDTH, num, endpoint=True)
+        ys = rng.integers(-HALF_WORLD_HEIGHT, HALF_WORLD_HEIGHT, num, endpoint=True)
+        vxs = sign() * rng.integers(1, MAX_STARTING_VELOCITY, num, endpoint=True)
+        vys = sign() * rng.integers(1, MAX_STARTING_VELOCITY, num, endpoint=True)
+        masses = rng.integers(1, MAX_STARTING_MASS, num, endpoint=True)
+        densities = rng.integers(1, MAX_STARTING_DENSITY, num, endpoint=True)
+        for args in zip(xs.tolist(), ys.tolist(), vxs.tolist(), vys.tolist(), masses.tolist(), densities.tolist()):
+            self.store.add(*args)
+
+    def advance(self, frame_dt: float, indices: np.ndarray | None = None, counter: dict | None = None) -> float:
+        """
+        Advances the simulation by one frame. With FIXED_TIMESTEP, runs as many PHYSICS_DT steps as the accumulated
+        frame time allows (zero or more, at most MAX_PHYSICS_STEPS); otherwise runs one step of frame_dt.
+        Args:
+            frame_dt (float): Time since the last frame in seconds.
+            indices (np.ndarray | None): Rows to update. Every particle not in the creation menu if None.
+            counter (dict | None): Debug counters.
+        Returns:
+            float: How far the simulated time is between the previous and the current positions, in [0, 1],
+                for interpolating what is drawn. 1 when not using a fixed timestep.
+        """
+        if not FIXED_TIMESTEP:
+            self.step(frame_dt, indices, counter)
+            return 1.0
+        self.accumulator += frame_dt
+        ids = self.store.ids[indices] if indices is not None else None
+        steps = 0
+        while self.accumulator >= PHYSICS_DT and steps < MAX_PHYSICS_STEPS:
+            # merges compact the store, so later steps find their rows by id
+            self.step(PHYSICS_DT, self.store.rows_of(ids) if steps and ids is not None else indices, counter)
+            self.accumulator -= PHYSICS_DT
+            steps += 1
+        if steps == MAX_PHYSICS_STEPS:
+            self.accumulator = min(self.accumulator, PHYSICS_DT)
+        return self.accumulator / PHYSICS_DT
+
+    def load(self, snapshot: Snapshot, store: ParticleStore | None = None) -> np.ndarray:
+        """
+        Replaces every particle with the ones in a snapshot and restores the simulated time.
+        Args:
+            snapshot (Snapshot): A loaded snapshot.
+            store (ParticleStore | None): Store to load the particles into. The simulated one if None.
+        Returns:
+            np.ndarray: The rows of the loaded particles.
+        """
+        store = store if store is not None else self.store
+        store.clear()
+        columns = snapshot.columns
+        rows = store.extend(columns["pos"], columns["vel"], columns["mass"], columns["density"], columns["acc"], columns["ids"])
+        store.next_id = max(store.next_id, snapshot.next_id)
+        self.time = snapshot.time
+        self.steps = snapshot.steps
+        self.accumulator = 0.0
+        return rows
+
+    def close(self) -> None:
+        """
+        Stops the force worker processes and flushes the recorder and diagnostics log, if any.
+        """
+        if isinstance(self.forces, ParallelForces):
+            self.forces.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.diagnostics is not None:
+            self.diagnostics.close()
+
+    def rebuild_grid(self, indices: np.ndarray, store: ParticleStore | None = None) -> None:
+        """
+        Refills the spatial grid with the given particles.
+        Args:
+            indices (np.ndarray): Rows to add to the grid.
+            store (ParticleStore | None): Store the rows belong to. The simulated one if None.
+        """
+        store = store if store is not None else self.store
+        self.grid.clear_grid()
+        for i, x, y in zip(indices.tolist(), store.x[indices].tolist(), store.y[indices].tolist()):
+            self.grid.add_particle(i, x, y)
+
+    def step(self, dt: float, indices: np.ndarray | None = None, counter: dict | None = None) -> None:
+        """
+        Advances the simulation by one step.
+        Args:
+            dt (float): Time step in seconds.
+            indices (np.ndarray | None): Rows to update. Every particle not in the creation menu if None.
+            counter (dict | None): Debug counters.
+        """
+        if indices is None:
+            indices = np.arange(len(self.store))
+        indices = indices[(self.store.flags[indices] & IN_MENU) == 0]
+
+        # the first kick (and the first block levels) of new and loaded particles need their accelerations
+        new = indices[(self.store.flags[indices] & NEEDS_FORCES) != 0]
+        if len(new):
+            with self.profiler.section("tree"):
+                build_quadtree(self.quadtree, self.store, indices)
+            with self.profiler.section("forces"):
+                self.store.acc[new] = calculate_accelerations(self.store, new, self.quadtree, self.forces)
+            self.store.flags[new] &= ~np.uint8(NEEDS_FORCES)
+        if not BATCHED_COLLISIONS:
+            with self.profiler.section("collisions"):
+                self.rebuild_grid(indices)
+
+        args = (self.store, indices, dt, self.grid, self.quadtree, counter if counter is not None else {}, self.profiler, self.forces)
+        if self.block_timesteps:
+            self.block_stats = update_particles_blocks(*args)
+        else:
+            update_particles(*args, self.integrator)
+        self.time += dt
+        self.steps += 1
+        if self.recorder is not None:
+            self.recorder.append(self)
+        if self.diagnostics is not None:
+            with self.profiler.section("diagnostics"):
+                self.diagnostics.append(self)
+        if self.tuner is not None and isinstance(self.quadtree, LinearQuadTree):
+            with self.profiler.section("tuning"):
+                self.tuner.update(self.quadtree)
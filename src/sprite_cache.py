@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from settings import *
+
+
+class SpriteCache:
+    """
+    LRU cache of particle surfaces, keyed on (radius, color, quantised zoom).
+    Zoomed surfaces are made by rotozooming the unzoomed one, so every particle of the same size and color shares one
+    prescaled surface per zoom level instead of being rotozoomed every frame.
+    Args:
+        budget (int): Max total size of the cached surfaces in bytes. The least recently used ones are evicted past this.
+        zoom_step (float): Relative zoom change between two cached zoom levels.
+    """
+    def __init__(self, budget: int, zoom_step: float = SPRITE_CACHE_ZOOM_STEP) -> None:
+        self.budget = budget
+        self.log_step = math.log1p(zoom_step)
+        self.surfs: OrderedDict[tuple, pygame.Surface] = OrderedDict()
+        self.size = 0 # bytes
+        self.hits = self.misses = self.evictions = 0
+
+    def level(self, zoom: float) -> int:
+        """
+        Returns the cached zoom level nearest to a zoom. Level 0 is unzoomed.
+        """
+        return round(math.log(zoom) / self.log_step) if zoom != 1 else 0
+
+    def get(self, radius: int, color: tuple | str, zoom: float = 1) -> pygame.Surface:
+        """
+        Looks up (or makes and caches) the surface of a particle.
+        Args:
+            radius (int): Unzoomed radius of the particle.
+            color (ColorLike): Color of the particle.
+            zoom (float): Camera zoom. Rounded to the nearest cached zoom level.
+        Returns:
+            pygame.Surface: The particle's circle, scaled by the zoom.
+        """
+        return self.lookup(radius, color, self.level(zoom))
+
+    def lookup(self, radius: int, color: tuple | str, level: int) -> pygame.Surface:
+        """
+        Same as get(), with the zoom level already worked out by level().
+        """
+        key = (radius, color, level)
+        surf = self.surfs.get(key)
+        if surf is not None:
+            self.surfs.move_to_end(key)
+            self.hits += 1
+            return surf
+
+        self.misses += 1
+        if level == 0:
+            surf = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
+            pygame.draw.circle(surf, color, (radius, radius), radius)
+        else:
+            surf = pygame.transform.rotozoom(self.get(radius, color), 0, math.exp(level * self.log_step))
+        self.surfs[key] = surf
+        self.size += self.surf_size(surf)
+        while self.size > self.budget and len(self.surfs) > 1:
+            _, evicted = self.surfs.popitem(last=False)
+            self.size -= self.surf_size(evicted)
+            self.evictions += 1
+        return surf
+
+    @staticmethod
+    def surf_size(surf: pygame.Surface) -> int:
+        return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit, miss and eviction counts, the number of cached surfaces and their total size in bytes.
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "surfaces": len(self.surfs), "bytes": self.size}
+
+    def clear(self) -> None:
+        self.surfs.clear()
+        self.size = 0
+
+
+sprite_cache = SpriteCache(SPRITE_CACHE_BYTES)
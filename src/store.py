@@ -0,0 +1,366 @@
+from settings import *
+from utils import calculate_radius, calculate_radii, combined_density
+
+# every per-particle column: name -> (dtype, shape of one row)
+COLUMNS = {
+    "_pos": (np.float64, (2,)),
+    "_prev_pos": (np.float64, (2,)),
+    "_vel": (np.float64, (2,)),
+    "_acc": (np.float64, (2,)),
+    "_mass": (np.float64, ()),
+    "_density": (np.float64, ()),
+    "_radius": (np.float64, ()),
+    "_color_mass": (np.float64, ()),
+    "_color_idx": (np.int8, ()),
+    "_flags": (np.uint8, ()),
+    "_ids": (np.int64, ()),
+}
+
+class ParticleStore:
+    """
+    Structure-of-arrays storage for every particle in the simulation.
+    Each attribute lives in its own contiguous NumPy array so physics, culling and coloring can run over all particles at once.
+    Rows [0, n) are live. Killed or merged particles are swap-removed so the live rows stay packed.
+    Args:
+        capacity (int): Number of rows to preallocate. The arrays grow geometrically past this.
+    """
+    def __init__(self, capacity: int = MAX_PARTICLES) -> None:
+        self.n = 0
+        self.next_id = 0
+        self.handles = [] # Particle handle (or None) for every live row
+        self.commands = None # edits recorded for replay on another store, see Pipeline
+        self._allocate(max(1, capacity))
+
+    def _allocate(self, capacity: int) -> None:
+        """
+        (Re)allocates every column with the given capacity, keeping the live rows.
+        Args:
+            capacity (int): New number of rows.
+        """
+        old = self.__dict__.get("_pos")
+        for name, (dtype, shape) in COLUMNS.items():
+            new = np.zeros((capacity, *shape), dtype=dtype)
+            if old is not None:
+                new[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def _columns(self) -> list[np.ndarray]:
+        return [getattr(self, name) for name in COLUMNS]
+
+    # live views over rows [0, n). these are invalidated if the store grows.
+    @property
+    def pos(self) -> np.ndarray: return self._pos[:self.n]
+    @property
+    def prev_pos(self) -> np.ndarray: return self._prev_pos[:self.n]
+    @property
+    def vel(self) -> np.ndarray: return self._vel[:self.n]
+    @property
+    def acc(self) -> np.ndarray: return self._acc[:self.n]
+    @property
+    def x(self) -> np.ndarray: return self._pos[:self.n, 0]
+    @property
+    def y(self) -> np.ndarray: return self._pos[:self.n, 1]
+    @property
+    def mass(self) -> np.ndarray: return self._mass[:self.n]
+    @property
+    def density(self) -> np.ndarray: return self._density[:self.n]
+    @property
+    def radius(self) -> np.ndarray: return self._radius[:self.n]
+    @property
+    def color_idx(self) -> np.ndarray: return self._color_idx[:self.n]
+    @property
+    def flags(self) -> np.ndarray: return self._flags[:self.n]
+    @property
+    def ids(self) -> np.ndarray: return self._ids[:self.n]
+
+    def __len__(self) -> int:
+        return self.n
+
+    def copy(self) -> "ParticleStore":
+        """
+        Returns a copy of the live rows without sprite handles.
+        """
+        other = ParticleStore(self.n)
+        other.n = self.n
+        other.next_id = self.next_id
+        other.handles = [None] * self.n
+        for name in COLUMNS:
+            getattr(other, name)[:self.n] = getattr(self, name)[:self.n]
+        return other
+
+    def add(self, x: float, y: float, vx: float, vy: float, mass: float, density: float, flags: int = 0, handle=None) -> int:
+        """
+        Appends a particle to the store.
+        Args:
+            x, y (float): Position.
+            vx, vy (float): Velocity.
+            mass (float): Particle mass.
+            density (float): Particle density.
+            flags (int): Initial bit flags. NEEDS_FORCES is always added.
+            handle (Particle | None): Sprite handle that mirrors this row, if any.
+        Returns:
+            int: The row index of the new particle.
+        """
+        if self.n == self.capacity:
+            self._allocate(self.capacity * 2)
+        i = self.n
+        self._pos[i] = self._prev_pos[i] = (x, y)
+        self._vel[i] = (vx, vy)
+        self._acc[i] = (0, 0)
+        self._mass[i] = mass
+        self._density[i] = density
+        self._radius[i] = calculate_radius(mass, density)
+        self._color_mass[i] = np.nan
+        self._color_idx[i] = -1
+        self._flags[i] = flags | NEEDS_FORCES
+        self._ids[i] = self.next_id
+        self.next_id += 1
+        self.handles.append(handle)
+        self.n += 1
+        if self.commands is not None:
+            self.commands.append(("add", int(self._ids[i])))
+        return i
+
+    def extend(self, pos: np.ndarray, vel: np.ndarray, mass: np.ndarray, density: np.ndarray,
+               acc: np.ndarray | None = None, ids: np.ndarray | None = None) -> np.ndarray:
+        """
+        Appends many particles at once, without sprite handles.
+        Args:
+            pos, vel (np.ndarray): (n, 2) positions and velocities.
+            mass, density (np.ndarray): Masses and densities.
+            acc (np.ndarray | None): (n, 2) accelerations from the last step. Zero if None. The rows still get
+                NEEDS_FORCES, so they are recomputed before they are stepped.
+            ids (np.ndarray | None): Particle ids to keep, e.g. from a snapshot. New ids are given out if None.
+        Returns:
+            np.ndarray: The row indices of the new particles.
+        """
+        count = len(mass)
+        capacity = self.capacity
+        while self.n + count > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            self._allocate(capacity)
+        rows = np.arange(self.n, self.n + count)
+        self._pos[rows] = self._prev_pos[rows] = pos
+        self._vel[rows] = vel
+        self._acc[rows] = acc if acc is not None else 0
+        self._mass[rows] = mass
+        self._density[rows] = density
+        self._radius[rows] = calculate_radii(self._mass[rows], self._density[rows])
+        self._color_mass[rows] = np.nan
+        self._color_idx[rows] = -1
+        self._flags[rows] = NEEDS_FORCES
+        self._ids[rows] = ids if ids is not None else np.arange(self.next_id, self.next_id + count)
+        if count:
+            self.next_id = max(self.next_id, int(self._ids[rows].max()) + 1)
+        self.handles.extend([None] * count)
+        self.n += count
+        if self.commands is not None:
+            self.commands.extend(("add", id) for id in self._ids[rows].tolist())
+        return rows
+
+    def clear(self) -> None:
+        """
+        Removes every particle and kills their sprite handles.
+        """
+        if self.commands is not None:
+            self.commands.extend(("remove", id) for id in self.ids.tolist())
+        handles = self.handles
+        self.handles = []
+        self.n = 0
+        for handle in handles:
+            if handle is not None:
+                handle.index = None
+                handle.kill()
+
+    def edit(self, i: int, column: str, value) -> None:
+        """
+        Writes a value into row i of a column, recording the edit if commands are being recorded.
+        Args:
+            i (int): Row index.
+            column (str): Name of a view property, e.g. "x" or "vel".
+            value: Value to write.
+        """
+        getattr(self, column)[i] = value
+        if self.commands is not None:
+            self.commands.append(("edit", int(self._ids[i]), column, value))
+
+    def add_row(self, source: "ParticleStore", i: int) -> int:
+        """
+        Appends a copy of row i of another store, id included.
+        Args:
+            source (ParticleStore): Store to copy from.
+            i (int): Row index in `source`.
+        Returns:
+            int: The row index of the new particle.
+        """
+        if self.n == self.capacity:
+            self._allocate(self.capacity * 2)
+        row = self.n
+        for name in COLUMNS:
+            getattr(self, name)[row] = getattr(source, name)[i]
+        self.next_id = max(self.next_id, int(self._ids[row]) + 1)
+        self.handles.append(None)
+        self.n += 1
+        return row
+
+    def remove(self, i: int) -> None:
+        """
+        Swap-removes row i: the last row is moved into its place and its handle re-pointed.
+        Kills the removed particle's sprite handle, if it has one.
+        Args:
+            i (int): Row index to remove.
+        """
+        if self.commands is not None:
+            self.commands.append(("remove", int(self._ids[i])))
+        last = self.n - 1
+        handle = self.handles[i]
+        if i != last:
+            for column in self._columns():
+                column[i] = column[last]
+            moved = self.handles[last]
+            self.handles[i] = moved
+            if moved is not None:
+                moved.index = i
+        self.handles.pop()
+        self.n = last
+        if handle is not None:
+            handle.index = None
+            handle.kill()
+
+    def rows_of(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Finds the rows of the given particle ids, skipping ids that are not in the store.
+        Args:
+            ids (np.ndarray): Particle ids.
+        Returns:
+            np.ndarray: Row index of every id that was found, in the same order.
+        """
+        if self.n == 0:
+            return np.empty(0, dtype=np.int64)
+        order = np.argsort(self.ids)
+        rows = order[np.minimum(np.searchsorted(self.ids[order], ids), self.n - 1)]
+        return rows[self.ids[rows] == ids]
+
+    def replay(self, commands: list[tuple], source: "ParticleStore") -> None:
+        """
+        Applies edits recorded on another store to the same particles (matched by id) in this one.
+        Added particles are copied from `source` as they are now. Edits to particles this store no longer has are dropped.
+        Args:
+            commands (list[tuple]): Recorded ("add", id), ("edit", id, column, value) and ("remove", id) commands.
+            source (ParticleStore): The store the commands were recorded on.
+        """
+        if not commands:
+            return
+        rows = dict(zip(self.ids.tolist(), range(self.n)))
+        source_rows = None
+        for command in commands:
+            kind, id = command[0], command[1]
+            if kind == "add":
+                if source_rows is None:
+                    source_rows = dict(zip(source.ids.tolist(), range(source.n)))
+                if id in source_rows:
+                    rows[id] = self.add_row(source, source_rows[id])
+            elif id in rows:
+                if kind == "edit":
+                    getattr(self, command[2])[rows[id]] = command[3]
+                else:
+                    self.kill(rows.pop(id))
+        self.compact()
+
+    def mirror(self, other: "ParticleStore", keep: Sequence[str] = ("_color_mass", "_color_idx")) -> None:
+        """
+        Makes this store a copy of another one that holds a subset of its particles, in the other store's row order.
+        Sprite handles are re-pointed to their particle's new row; handles of particles the other store lacks are killed.
+        Args:
+            other (ParticleStore): Store to copy. Every one of its ids must be in this store.
+            keep (Sequence[str]): Columns kept from this store rather than copied.
+        """
+        source = self.rows_of(other.ids) # this store's row of every row of `other`
+        gone = np.setdiff1d(np.arange(self.n), source, assume_unique=True)
+        kept = {name: getattr(self, name)[:self.n][source] for name in keep}
+        if other.n > self.capacity:
+            self._allocate(other.capacity)
+        for name in COLUMNS:
+            getattr(self, name)[:other.n] = kept[name] if name in kept else getattr(other, name)[:other.n]
+        handles = self.handles
+        self.handles = [handles[i] for i in source.tolist()]
+        self.n = other.n
+        self.next_id = max(self.next_id, other.next_id)
+        for row, handle in enumerate(self.handles):
+            if handle is not None:
+                handle.index = row
+        for i in gone.tolist():
+            if handles[i] is not None:
+                handles[i].index = None
+                handles[i].kill()
+
+    def kill(self, i: int) -> None:
+        """
+        Marks row i as dead without moving anything. Dead rows are removed by compact().
+        Args:
+            i (int): Row index to kill.
+        """
+        self._flags[i] |= DEAD
+
+    def compact(self) -> None:
+        """
+        Swap-removes every row marked dead, highest index first so no dead row gets moved.
+        """
+        for i in np.flatnonzero(self.flags & DEAD)[::-1]:
+            self.remove(int(i))
+
+    def merge(self, i: int, j: int) -> int:
+        """
+        Merges two particles, conserving mass and momentum. The heavier one (or the older one on a tie) survives
+        at its own position and the other is marked dead.
+        Args:
+            i, j (int): Row indices of the colliding particles.
+        Returns:
+            int: Row index of the surviving particle.
+        """
+        if self._mass[i] < self._mass[j] or (self._mass[i] == self._mass[j] and self._ids[i] > self._ids[j]):
+            i, j = j, i
+        m1, m2 = self._mass[i], self._mass[j]
+        self._vel[i] = (m1 * self._vel[i] + m2 * self._vel[j]) / (m1 + m2)
+        self._density[i] = combined_density(m1, self._radius[i], m2, self._radius[j])
+        self._mass[i] = m1 + m2
+        self._radius[i] = calculate_radius(self._mass[i], self._density[i])
+        self.kill(j)
+        return i
+
+    def update_radii(self, indices: np.ndarray | None = None) -> None:
+        """
+        Recalculates radii from mass and density.
+        Args:
+            indices (np.ndarray | None): Rows to update. Every live row if None.
+        """
+        if indices is None:
+            indices = slice(0, self.n)
+        self._radius[indices] = calculate_radii(self._mass[indices], self._density[indices])
+
+    def update_colors(self, percentiles: np.ndarray | None, indices: np.ndarray | None = None, much: float = 1000) -> None:
+        """
+        Assigns every particle the color of the mass percentile bin it falls into.
+        A particle is only recolored once its mass has changed by at least `much` since it was last colored.
+        Args:
+            percentiles (np.ndarray): the color bins.
+            indices (np.ndarray | None): Rows to update. Every live row if None.
+            much (float): Mass change needed before a particle is recolored.
+        """
+        if percentiles is None:
+            return
+        if indices is None:
+            indices = np.arange(self.n)
+        mass = self._mass[indices]
+        old_mass = self._color_mass[indices]
+        stale = np.isnan(old_mass) | (np.abs(mass - old_mass) >= much)
+        if not stale.any():
+            return
+        indices = indices[stale]
+        mass = mass[stale]
+        bins = np.searchsorted(percentiles, mass, side="right") - 1
+        bins[(bins < 0) | (bins >= len(percentiles) - 1)] = len(PARTICLE_COLORS) - 1
+        self._color_idx[indices] = bins
+        self._color_mass[indices] = mass
@@ -0,0 +1,174 @@
+"""
+Append-only trajectory files: the state of every particle after every recorded step.
+
+A trajectory is two files. `path` holds a 64 byte header (magic, version) followed by one record per particle per
+step. `path.idx` holds one entry per step with the step number, sim time and the range of records that belong to it.
+Both are only ever appended to. The records are read back as a memory map, so any step can be shown without
+reading the ones before it.
+"""
+import os
+import struct
+from settings import *
+from store import ParticleStore
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+TRAJECTORY_MAGIC = b"GRAVTRAJ"
+TRAJECTORY_VERSION = 1
+TRAJECTORY_HEADER_SIZE = 64
+TRAJECTORY_DTYPE = np.dtype([("id", "<i8"), ("x", "<f4"), ("y", "<f4"), ("mass", "<f4"), ("density", "<f4")])
+TRAJECTORY_INDEX_DTYPE = np.dtype([("step", "<i8"), ("time", "<f8"), ("start", "<i8"), ("count", "<i8")])
+
+
+class TrajectoryRecorder:
+    """
+    Appends the particles of a simulation to a trajectory file after every step.
+    Steps are buffered and written in chunks, so recording costs one array copy per step.
+    Args:
+        path (str): Trajectory file. Recording into an existing trajectory appends to it.
+        chunk_records (int): Records buffered before they are written out.
+    Raises:
+        ValueError: If `path` exists but is not a trajectory or its index file is missing.
+    """
+    def __init__(self, path: str, chunk_records: int = 1 << 20) -> None:
+        self.path = path
+        self.chunk_records = chunk_records
+        self.records: list[np.ndarray] = []
+        self.entries: list[tuple] = []
+        self.buffered = 0
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(struct.pack("<8sI", TRAJECTORY_MAGIC, TRAJECTORY_VERSION).ljust(TRAJECTORY_HEADER_SIZE, b"\0"))
+            open(path + ".idx", "wb").close()
+            self.written = 0
+            return
+        _read_header(path)
+        if not os.path.exists(path + ".idx"): # the step boundaries are only in the index, so it can't be rebuilt
+            raise ValueError(f"{path} exists but its index {path}.idx is missing, refusing to overwrite it")
+        index = np.fromfile(path + ".idx", dtype=TRAJECTORY_INDEX_DTYPE)
+        self.written = int(index["start"][-1] + index["count"][-1]) if len(index) else 0
+
+    def append(self, sim: "Simulation") -> None:
+        """
+        Records the current state of every simulated particle (the ones in the creation menu are left out).
+        Args:
+            sim (Simulation): The simulation to record.
+        """
+        store = sim.store
+        rows = np.flatnonzero((store.flags & IN_MENU) == 0)
+        records = np.empty(len(rows), dtype=TRAJECTORY_DTYPE)
+        records["id"] = store.ids[rows]
+        records["x"] = store.x[rows]
+        records["y"] = store.y[rows]
+        records["mass"] = store.mass[rows]
+        records["density"] = store.density[rows]
+        self.entries.append((sim.steps, sim.time, self.written + self.buffered, len(rows)))
+        self.records.append(records)
+        self.buffered += len(rows)
+        if self.buffered >= self.chunk_records:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered steps. Records go out before their index entries, so a reader never sees a step
+        whose records are missing.
+        """
+        if not self.entries:
+            return
+        with open(self.path, "ab") as f:
+            for records in self.records:
+                records.tofile(f)
+        with open(self.path + ".idx", "ab") as f:
+            np.array(self.entries, dtype=TRAJECTORY_INDEX_DTYPE).tofile(f)
+        self.written += self.buffered
+        self.records.clear()
+        self.entries.clear()
+        self.buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+
+
+def _read_header(path: str) -> None:
+    with open(path, "rb") as f:
+        magic, version = struct.unpack("<8sI", f.read(12))
+    if magic != TRAJECTORY_MAGIC:
+        raise ValueError(f"{path} is not a trajectory file")
+    if version != TRAJECTORY_VERSION:
+        raise ValueError(f"{path} has trajectory version {version}, expected {TRAJECTORY_VERSION}")
+
+
+class TrajectoryPlayer:
+    """
+    Plays a recorded trajectory back into a store, so the normal camera and drawing code can show it.
+    Playback follows the recorded sim time, scaled by `speed`.
+    Args:
+        path (str): Trajectory file.
+    """
+    def __init__(self, path: str) -> None:
+        _read_header(path)
+        self.index = np.fromfile(path + ".idx", dtype=TRAJECTORY_INDEX_DTYPE)
+        if len(self.index) == 0:
+            raise ValueError(f"{path} has no recorded steps")
+        count = int(self.index["start"][-1] + self.index["count"][-1])
+        self.records = np.memmap(path, dtype=TRAJECTORY_DTYPE, mode="r", offset=TRAJECTORY_HEADER_SIZE, shape=(count,))
+        self.position = 0 # index entry being shown
+        self.time = float(self.index["time"][0])
+        self.speed = 1.0
+        self.paused = False
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def frame(self, position: int) -> np.ndarray:
+        """
+        Returns the records of one recorded step, as a view into the file.
+        Args:
+            position (int): Index entry, 0 for the first recorded step.
+        """
+        entry = self.index[position]
+        return self.records[entry["start"]:entry["start"] + entry["count"]]
+
+    def seek(self, position: int) -> None:
+        """
+        Jumps to a recorded step, clamped to the recording.
+        Args:
+            position (int): Index entry.
+        """
+        self.position = min(max(position, 0), len(self) - 1)
+        self.time = float(self.index["time"][self.position])
+
+    def update(self, dt: float) -> None:
+        """
+        Moves playback forward by dt seconds of wall time, unless paused.
+        Args:
+            dt (float): Time since the last frame.
+        """
+        if self.paused:
+            return
+        self.time += dt * self.speed
+        self.position = max(int(np.searchsorted(self.index["time"], self.time, side="right")) - 1, 0)
+        if self.position == len(self) - 1:
+            self.paused = True
+
+    def show(self, store: ParticleStore) -> np.ndarray:
+        """
+        Makes the store hold exactly the particles of the current step. Particles are matched by id, so sprite handles
+        and colors carry over between steps; handles of particles that are not in the step are killed.
+        Args:
+            store (ParticleStore): Store to fill.
+        Returns:
+            np.ndarray: Rows of particles that were not in the store before and need sprite handles.
+        """
+        frame = self.frame(self.position)
+        ids = np.asarray(frame["id"])
+        pos = np.column_stack((frame["x"], frame["y"]))
+        zeros = np.zeros_like(pos)
+
+        step = ParticleStore(len(frame))
+        step.extend(pos, zeros, frame["mass"], frame["density"], ids=ids)
+        new = ~np.isin(ids, store.ids)
+        if new.any():
+            store.extend(pos[new], zeros[new], frame["mass"][new], frame["density"][new], ids=ids[new])
+        store.mirror(step)
+        return store.rows_of(ids[new])
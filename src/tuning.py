@@ -0,0 +1,78 @@
+"""
+Barnes-hut accuracy auto-tuning: every step the tree forces of a few random particles are checked against a direct
+sum, and the opening angle is nudged towards the largest one whose force error stays at the target.
+
+A larger theta means shorter interaction lists, so the largest theta that meets the target is the cheapest one.
+"""
+from settings import *
+from barnes_hut import BarnesHutForces
+from direct import DirectForces
+from linear_tree import LinearQuadTree
+if TYPE_CHECKING:
+    from parallel import ParallelForces
+
+THETA_RANGE = (0.01, 1.5) # the tuner keeps theta inside this
+ERROR_EXPONENT = 2 # the barnes-hut force error grows about like theta**2 (the quadrupole term leads)
+MAX_CHANGE = 1.1 # max factor theta changes by in one update
+
+
+class ThetaTuner:
+    """
+    Keeps the force error of a barnes-hut evaluator at a target by adjusting its theta after every step.
+    The error is the median, over `samples` random particles of the tree, of |a_tree - a_direct| / |a_direct|. It is
+    smoothed over steps, and theta is scaled by (target / error) ** (1 / ERROR_EXPONENT), at most MAX_CHANGE per update.
+    Args:
+        forces (BarnesHutForces | ParallelForces): Evaluator whose theta is tuned. Its opening criterion is kept.
+        target (float): Median relative force error to aim for.
+        samples (int): Particles checked per update.
+        smoothing (float): Weight of the newest measurement in the running error.
+        seed (int | None): Seed of the particle sampling.
+    """
+    def __init__(self, forces: "BarnesHutForces | ParallelForces", target: float = BH_TARGET_ERROR, samples: int = BH_TUNER_SAMPLES,
+                 smoothing: float = 0.3, seed: int | None = None) -> None:
+        self.forces = forces
+        self.target = target
+        self.samples = samples
+        self.smoothing = smoothing
+        self.rng = np.random.default_rng(seed)
+        self.probe = BarnesHutForces() # serial copy of the evaluator's settings, so ParallelForces can be tuned too
+        self.reference = DirectForces()
+        self.error: float | None = None # running median relative force error
+        self.interactions = 0.0 # mean interaction list length of the last samples, the work per particle
+
+    def measure(self, tree: LinearQuadTree) -> tuple[float, float]:
+        """
+        Checks random particles of a tree at the evaluator's current theta and opening criterion.
+        The "relative" criterion is given the direct accelerations as the particles' last ones.
+        Args:
+            tree (LinearQuadTree): A built tree with at least one particle.
+        Returns:
+            tuple:
+                - error (float): Median relative force error of the samples.
+                - interactions (float): Mean interaction list length of the samples.
+        """
+        rows = self.rng.choice(len(tree.x), min(self.samples, len(tree.x)), replace=False)
+        x, y = tree.x[rows], tree.y[rows]
+        direct = self.reference.accelerations(tree, x, y)
+        magnitude = np.hypot(direct[:, 0], direct[:, 1])
+
+        self.probe.theta, self.probe.opening = self.forces.theta, self.forces.opening
+        offsets, sources = self.probe.interaction_lists(tree, x, y, magnitude)
+        approx = np.zeros((len(rows), 2))
+        self.probe.evaluate(tree, x, y, offsets, sources, approx)
+        error = np.hypot(approx[:, 0] - direct[:, 0], approx[:, 1] - direct[:, 1]) / np.maximum(magnitude, 1e-300)
+        return float(np.median(error)), len(sources) / len(rows)
+
+    def update(self, tree: LinearQuadTree) -> None:
+        """
+        Measures the force error on a tree and adjusts the evaluator's theta.
+        Args:
+            tree (LinearQuadTree): The tree the last forces were computed on.
+        """
+        if len(tree.x) < 2:
+            return
+        error, self.interactions = self.measure(tree)
+        self.error = error if self.error is None else self.error + self.smoothing * (error - self.error)
+        factor = (self.target / max(self.error, 1e-12)) ** (1 / ERROR_EXPONENT)
+        theta = self.forces.theta * min(max(factor, 1 / MAX_CHANGE), MAX_CHANGE)
+        self.forces.theta = min(max(theta, THETA_RANGE[0]), THETA_RANGE[1])
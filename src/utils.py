@@ -1,41 +1,33 @@
 from settings import *
 from chatlog import LogText
+from linear_tree import LinearQuadTree
+from node_pool import NodePool
+from barnes_hut import BarnesHutForces
+from parallel import ParallelForces
+from fmm import FMMForces
+from pm import ParticleMeshForces
+from direct import DirectForces
+from profiler import FrameProfiler
+from collisions import merge_collisions
+from integrators import INTEGRATORS, Leapfrog, window_collisions
+from contextlib import nullcontext
 if TYPE_CHECKING:
-    from particle import Particle
     from cam import Cam
+    from store import ParticleStore
 
-def combined_masses(p1: "Particle", p2: "Particle") -> float:
-    """
-    Return the sum of the masses of two particles.
-    Args:
-        p1, p2: Particle objects with a mass attribute.
-    Returns:
-        float: Combined mass.
-    """
-    return p1.mass + p2.mass
-
-def velocity_of_combined_particles(p1: "Particle", p2: "Particle") -> pygame.Vector2:
-    """
-    Calculate the velocity of two combined particles using conservation of momentum.
-    Args:
-        p1, p2: Particle objects with mass and velocity attributes.
-    Returns:
-        Vector2: Resulting velocity.
-    """
-    return ((p1.mass * p1.v) + (p2.mass * p2.v)) / (p1.mass + p2.mass)
-
-def combined_density(p1: "Particle", p2: "Particle") -> float:
+def combined_density(m1: float, r1: float, m2: float, r2: float) -> float:
     """
     Calculates the density of two combined particles.
     Args:
-        p1, p2 (Particle): Particles with mass and density attributes.
+        m1, m2 (float): Masses of the particles.
+        r1, r2 (float): Radii of the particles.
     Returns:
         float: Calculated density.
     """
     # Area = pi * r^2 for each particle
-    area1 = math.pi * p1.radius**2
-    area2 = math.pi * p2.radius**2
-    total_mass = p1.mass + p2.mass
+    area1 = math.pi * r1**2
+    area2 = math.pi * r2**2
+    total_mass = m1 + m2
     total_area = area1 + area2
     # density = total_mass / total_area
     density = total_mass / total_area if total_area > 0 else 1.0
@@ -98,238 +90,276 @@ def truncate_decimal(decimal: float, decimal_places: int) -> float:
 class QuadTree:
     """
     Quadtree that partitions the game and helps it render fast.
+    The nodes live in a NodePool and are referred to by index, the root being node 0; dividing a node takes a block of
+    4 children from the pool and clear() hands them all back, so rebuilding the tree every frame allocates nothing.
     Args:
-            boundary (pygame.FRect or pygame.Rect): Bounding rectangle that represents the topleft and width+height of the Quadtree node.
+            boundary (pygame.FRect or pygame.Rect): Bounding rectangle that represents the topleft and width+height of the root node.
             capacity (int): Number of particles that can fit in any one node. Can be bypassed if certain conditions are met.
-            level (int): The level that the node rests at. The root node's level is 0.
+            cam (object): Kept for the callers that pass the camera; visualize() takes the zoom and offset instead.
             maxlevel (int): The maximum level a node can be.
     """
-    def __init__(self, boundary: pygame.FRect | pygame.Rect, capacity: int, cam: object, level: int=0, maxlevel: int=5) -> None:
-        # self.boundary = (left, top, length, width) of bounding rect.
-        self.boundary = boundary
+    def __init__(self, boundary: pygame.FRect | pygame.Rect, capacity: int, cam: object, maxlevel: int=5) -> None:
+        self.boundary = pygame.FRect(boundary)
         self.capacity = capacity
-        self.particles_in_node = []
-        self.divided = False
-        self.level = level
         self.maxlevel = maxlevel
-
-        self.nw = self.ne = self.sw = self.se = None
-        self.children = []
-
-        # used for visualization scaled with camera manipulations
         self.cam = cam
+        self.pool = NodePool()
+        self.pool.reset(self.boundary)
 
-        # used for barnes hut approximations
-        self.mass = 0.0
-        self.x_com = 0.0
-        self.y_com = 0.0
-        self.theta2 = 0.75**2
-        self.s2 = 0.0
+        # incremental mode (refit()): the node holding every particle by id, and how many moved last refit
+        self.leaves: dict[int, int] | None = None
+        self.relocated = 0
+
+        # used for barnes hut approximations, filled by calculate_CoM(): (x_com, y_com, mass, s2, first_child) of every
+        # node and the (x, y, mass) of every particle grouped by node, as lists for query_bh()'s python loop
+        self.nodes: list[tuple[float, float, float, float, int]] = []
+        self.particles: list[tuple[float, float, float]] = []
+        self.particle_ranges: list[tuple[int, int]] = [] # [start, stop) of every node's particles
 
     def clear(self) -> None:
         """
-        Clears the Quadtree and resets every node.
+        Clears the Quadtree, handing every node back to the pool.
         """
-        self.particles_in_node = []
-        if not self.divided:
-            return
-        for node in self.children:
-            node.clear()
-        self.children = []
-        self.divided = False
-        self.s2 = 0.0
+        self.pool.reset(self.boundary)
+        self.leaves = None
 
-    def insert(self, particle: "Particle") -> None:
+    def quadrant(self, node: int, x: float, y: float) -> int:
         """
-        Inserts a particle into the Quadtree.
+        Returns the child of a divided node that a position falls in.
         Args:
-            particle (Particle): The particle you wish to insert.
+            node (int): A divided node.
+            x, y (float): A position inside it.
         """
-        if not self.boundary.collidepoint((particle.x, particle.y)):
-            return
-
-        if len(self.particles_in_node) < self.capacity:
-            self.particles_in_node.append(particle)
-        else:
-            if self.level >= self.maxlevel:
-                self.particles_in_node.append(particle)
-                return
-            
-            if not self.divided:
-                self.divide_node()
-                self.place_particle(particle)
-            elif self.divided:
-                self.place_particle(particle)
+        pool = self.pool
+        return (pool.first_child[node] + (x >= pool.left[node] + pool.width[node] / 2)
+                + 2 * (y >= pool.top[node] + pool.height[node] / 2))
 
-    def divide_node(self) -> None:
+    def contains(self, node: int, x: float, y: float) -> bool:
         """
-        Divides a Quadtree node into 4 smaller nodes.
+        Checks if a position is inside a node, including its top and left edges like pygame.FRect.collidepoint().
         """
-        w_div_2 = self.boundary.width / 2
-        h_div_2 = self.boundary.height / 2
-        left = self.boundary.left
-        top = self.boundary.top
-        new_level = self.level + 1
-
-        self.nw = QuadTree(pygame.FRect(left, top, w_div_2, h_div_2), self.capacity, self.cam, new_level)
-        self.ne = QuadTree(pygame.FRect(left + w_div_2, top, w_div_2, h_div_2), self.capacity, self.cam, new_level)
-        self.sw = QuadTree(pygame.FRect(left, top + h_div_2, w_div_2, h_div_2), self.capacity, self.cam, new_level)
-        self.se = QuadTree(pygame.FRect(left + w_div_2, top + h_div_2, w_div_2, h_div_2), self.capacity, self.cam, new_level)
-        self.children = [self.nw, self.ne, self.sw, self.se]
-
-        self.divided = True
+        pool = self.pool
+        left, top = pool.left[node], pool.top[node]
+        return left <= x < left + pool.width[node] and top <= y < top + pool.height[node]
 
-        old_particles = self.particles_in_node
-        self.particles_in_node = []
-        for particle in old_particles:
-            self.place_particle(particle)
-
-    def place_particle(self, particle: "Particle"):
+    def insert(self, index: int, x: float, y: float, node: int = 0) -> None:
         """
-        Recursively looks through the Quadtree to find the node the particle belongs in.
+        Inserts a particle into the Quadtree.
         Args:
-            particle (Particle): the particle you wish to place into the Quadtree.
+            index (int): The particle's row in the ParticleStore.
+            x, y (float): The particle's position.
+            node (int): Node to insert from. It must contain the position, unless it is the root.
         """
-        for node in self.children:
-            if node.boundary.collidepoint((particle.x, particle.y)):
-                node.insert(particle)
-                return
-        self.particles_in_node.append(particle)
-
-    def calculate_CoM(self) -> tuple[float, float, float]:
+        if node == 0 and not self.boundary.collidepoint((x, y)):
+            return
+        pool = self.pool
+        while pool.first_child[node] >= 0:
+            node = self.quadrant(node, x, y)
+        while pool.count[node] >= self.capacity and pool.level[node] < self.maxlevel:
+            self.divide_node(node)
+            node = self.quadrant(node, x, y)
+        pool.link(node, pool.new_slot(index, x, y))
+
+    def divide_node(self, node: int) -> None:
+        """
+        Divides a Quadtree node into 4 smaller nodes and moves its particles into them.
+        Args:
+            node (int): A leaf.
+        """
+        pool = self.pool
+        pool.new_block(node)
+        slot = pool.head[node]
+        pool.head[node], pool.count[node] = -1, 0
+        while slot >= 0:
+            next_slot = pool.slot_next[slot]
+            pool.link(self.quadrant(node, pool.slot_x[slot], pool.slot_y[slot]), slot)
+            slot = next_slot
+
+    def refit(self, rows: Sequence[int], ids: Sequence[int], xs: Sequence[float], ys: Sequence[float]) -> int:
+        """
+        Updates the tree in place to the particles' new positions, ending up with the same nodes a rebuild would.
+        Particles still inside the leaf that held them stay there; the others climb to the first node containing them
+        and are inserted from there (splitting nodes that overflow). Then nodes left with `capacity` particles or fewer
+        are collapsed. Call calculate_CoM() afterwards.
+        Args:
+            rows (Sequence[int]): Store rows of the particles.
+            ids (Sequence[int]): Ids of the same particles, which unlike rows survive store compaction.
+            xs, ys (Sequence[float]): Their positions.
+        Returns:
+            int: Number of particles that left their leaf or were new.
+        """
+        pool = self.pool
+        leaves = self.leaves or {}
+        pool.clear_particles()
+        moved = []
+        for i, particle_id, x, y in zip(rows, ids, xs, ys):
+            leaf = leaves.get(particle_id)
+            if leaf is not None and pool.first_child[leaf] < 0 and self.contains(leaf, x, y):
+                pool.link(leaf, pool.new_slot(i, x, y))
+            else:
+                moved.append((i, leaf, x, y))
+        for i, node, x, y in moved: # after every staying particle, so inserts see the leaves' real counts
+            node = node if node is not None else 0
+            while node > 0 and not self.contains(node, x, y):
+                node = pool.parent[node]
+            self.insert(i, x, y, node)
+
+        self.collapse()
+        id_of = dict(zip(rows, ids))
+        self.leaves = {id_of[i]: node for i, node in zip(pool.slot_row[:pool.slots], pool.slot_node[:pool.slots])}
+        self.relocated = len(moved)
+        return self.relocated
+
+    def collapse(self, node: int = 0) -> int:
         """
-        Calculates the center of mass for every node in the quadtree.
+        Turns every divided node holding `capacity` particles or fewer back into a leaf, bottom-up, and hands its
+        children back to the pool.
+        Args:
+            node (int): Node to start from.
+        Returns:
+            int: Number of particles in the node and its children.
+        """
+        pool = self.pool
+        first = pool.first_child[node]
+        count = pool.count[node]
+        if first < 0:
+            return count
+        count += sum(self.collapse(child) for child in range(first, first + 4))
+        if count <= self.capacity:
+            for child in range(first, first + 4):
+                slot = pool.head[child]
+                while slot >= 0:
+                    next_slot = pool.slot_next[slot]
+                    pool.link(node, slot)
+                    slot = next_slot
+            pool.first_child[node] = -1
+            pool.free_block(first)
+        return count
+
+    def calculate_CoM(self, masses: Sequence[float] | np.ndarray) -> tuple[float, float, float]:
+        """
+        Calculates the center of mass for every node in the quadtree: leaf sums over the particle slots, then added
+        into the parents one level at a time from the deepest up. Nodes on the free list hold nothing, so they add nothing.
+        Also lays out the nodes and particles that query_bh() walks.
+        Args:
+            masses (Sequence[float] | np.ndarray): Mass of every particle, indexed by store row.
         Returns:
             tuple:
-                - mass (float): The total mass of this node and of its children.
-                - com (tuple[float, float]): The (x, y) coordinates of the center of mass.
-        """
-        if not self.divided:
-            self.mass = sum(p.mass for p in self.particles_in_node)
-            if self.mass:
-                self.x_com = sum(p.mass * p.x for p in self.particles_in_node) / self.mass
-                self.y_com = sum(p.mass * p.y for p in self.particles_in_node) / self.mass
-            return self.x_com, self.y_com, self.mass
-        
-        self.mass = self.x_com = self.y_com = 0.0
-        for node in self.children:
-            cx, cy, mass = node.calculate_CoM()
-            self.mass += mass
-            self.x_com += mass * cx
-            self.y_com += mass * cy
-        if self.mass:
-            self.x_com /= self.mass
-            self.y_com /= self.mass
-
-        return self.x_com, self.y_com, self.mass
-
-    def query_bh(self, particle: "Particle", pseudo_particles=None) -> list[tuple[float, float, float]] | np.ndarray:
+                - com (tuple[float, float]): The (x, y) coordinates of the root's center of mass.
+                - mass (float): The total mass of the tree.
+        """
+        pool = self.pool
+        n_nodes, n = pool.used, pool.slots
+        node_of = np.array(pool.slot_node[:n], dtype=np.int64)
+        rows = np.array(pool.slot_row[:n], dtype=np.int64)
+        x, y = np.array(pool.slot_x[:n]), np.array(pool.slot_y[:n])
+        m = np.asarray(masses, dtype=np.float64)[rows]
+
+        mass, x_com, y_com = pool.mass[:n_nodes], pool.x_com[:n_nodes], pool.y_com[:n_nodes]
+        mass[:] = np.bincount(node_of, weights=m, minlength=n_nodes)
+        x_com[:] = np.bincount(node_of, weights=m * x, minlength=n_nodes) # mass-weighted sums until the division
+        y_com[:] = np.bincount(node_of, weights=m * y, minlength=n_nodes)
+        level = np.array(pool.level[:n_nodes], dtype=np.int64)
+        parent = np.array(pool.parent[:n_nodes], dtype=np.int64)
+        for depth in range(int(level.max()), 0, -1):
+            nodes = np.flatnonzero(level == depth)
+            for values in (mass, x_com, y_com):
+                np.add.at(values, parent[nodes], values[nodes])
+        has_mass = mass != 0
+        np.divide(x_com, mass, out=x_com, where=has_mass)
+        np.divide(y_com, mass, out=y_com, where=has_mass)
+
+        s = np.maximum(np.array(pool.width[:n_nodes]), np.array(pool.height[:n_nodes]))
+        self.nodes = list(zip(x_com.tolist(), y_com.tolist(), mass.tolist(), (s*s).tolist(), pool.first_child[:n_nodes]))
+        order = np.argsort(node_of, kind="stable")
+        self.particles = list(zip(x[order].tolist(), y[order].tolist(), m[order].tolist()))
+        count = np.bincount(node_of, minlength=n_nodes)
+        stop = np.cumsum(count)
+        self.particle_ranges = list(zip((stop - count).tolist(), stop.tolist()))
+        return float(x_com[0]), float(y_com[0]), float(mass[0])
+
+    def query_bh(self, x: float, y: float, theta2: float = BH_THETA**2) -> np.ndarray:
         """
         Queries the quadtree for barnes-hut pseudo-particles to approximate forces.
+        A leaf too close to be used whole adds each of its particles instead.
         Args:
-            particle (Particle) : The particle you want to find the forces of.
+            x, y (float) : The position of the particle you want to find the forces of.
+            theta2 (float): Squared opening angle.
         Returns:
-            list[tuple[float, float, float] :
-                A list of pseudo-particles represented as tuples:
-                - x (float): the x coordinate of the center of mass
-                - y (float): the y coordinate of the center of mass
-                - mass (float): total mass of the pseudo-particle
-        """
-        if pseudo_particles is None:
-            pseudo_particles = []
-        
-        if not self.s2:
-            s = max(self.boundary.width, self.boundary.height)
-            self.s2 = s*s
-        dx = self.x_com - particle.x
-        dy = self.y_com - particle.y
-        d2 = dx*dx + dy*dy
+            np.ndarray: (n, 3) array of pseudo-particles as (x, y, mass).
+        """
         epsilon = 1e-5
-        if d2 < epsilon: # avoid division by zero
-            d2 = epsilon 
-
-        if self.s2 < self.theta2 * d2:
-            if self.mass:
-                pseudo_particles.append([self.x_com, self.y_com, self.mass])
-        else:
-            if not self.divided:
-                return pseudo_particles
-            for node in self.children:
-                if node.mass == 0:
-                    continue
-                node.query_bh(particle, pseudo_particles)
-
-        if self.level == 0:
-            pseudo_particles = np.array(pseudo_particles, dtype=np.float64)
-            if pseudo_particles.size == 0:
-                pseudo_particles = np.empty((0,3), dtype=np.float64)
-            elif pseudo_particles.ndim == 1:
-                pseudo_particles = pseudo_particles[np.newaxis, :]
-                
-        return pseudo_particles
-
-    def query_circle(self, particle: "Particle") -> list["Particle"]:
+        pseudo_particles = []
+        nodes = [0] if self.nodes else []
+        while nodes:
+            node = nodes.pop()
+            x_com, y_com, mass, s2, first_child = self.nodes[node]
+            dx = x_com - x
+            dy = y_com - y
+            d2 = dx*dx + dy*dy
+            if d2 < epsilon: # avoid division by zero
+                d2 = epsilon
+            if s2 < theta2 * d2:
+                if mass:
+                    pseudo_particles.append((x_com, y_com, mass))
+            elif first_child < 0:
+                start, stop = self.particle_ranges[node]
+                pseudo_particles.extend(self.particles[start:stop])
+            else:
+                nodes.extend(child for child in range(first_child, first_child + 4) if self.nodes[child][2])
+        if not pseudo_particles:
+            return np.empty((0, 3), dtype=np.float64)
+        return np.array(pseudo_particles, dtype=np.float64)
+
+    def query_circle(self, x: float, y: float, radius: float) -> list[int]:
         """
         DEPRECATED... SPATIALGRID USED FOR COLLISIONS INSTEAD.
-        Queries a circular area around the particle in order to find what particles (or so-called "neighbors") it may collide with.
+        Queries a circular area around a particle in order to find what particles (or so-called "neighbors") it may collide with.
         Args:
-            particle (Particle): The particle you want to find the neighbors of.
+            x, y (float): The position of the particle you want to find the neighbors of.
+            radius (float): The radius of that particle.
         Returns:
-            found_particles[Particle]: A list of all the neighbors your queried particle may collide with.
+            found_particles[int]: Store rows of all the neighbors your queried particle may collide with.
         """
-        center = (particle.x, particle.y)
-        radius = particle.radius + MAX_RADIUS * 2
-        query_rect = pygame.FRect(center[0] - radius, center[1] - radius, radius * 2, radius * 2)
+        pool = self.pool
+        radius = radius + MAX_RADIUS * 2
         found_particles = []
-
-        if not self.boundary.colliderect(particle.rect):
-            return found_particles
-        
-        for p in self.particles_in_node:
-            dx = p.x - center[0]
-            dy = p.y - center[1]
-            distance2 = dx**2 + dy**2
-            if distance2 <= radius**2:
-                found_particles.append(p)
-
-        if not self.divided:
-            return found_particles
-        
-        for node in self.children:
-            found_particles.extend(node.query_circle(particle))
-
+        nodes = [0]
+        while nodes:
+            node = nodes.pop()
+            left, top = pool.left[node], pool.top[node]
+            if x + radius <= left or x - radius >= left + pool.width[node] or y + radius <= top or y - radius >= top + pool.height[node]:
+                continue
+            slot = pool.head[node]
+            while slot >= 0:
+                dx = pool.slot_x[slot] - x
+                dy = pool.slot_y[slot] - y
+                if dx**2 + dy**2 <= radius**2:
+                    found_particles.append(pool.slot_row[slot])
+                slot = pool.slot_next[slot]
+            first = pool.first_child[node]
+            if first >= 0:
+                nodes.extend(range(first, first + 4))
         return found_particles
 
-    def draw_line(self, p1: "Particle", p2: "Particle", zoom: float, offset: pygame.Vector2):
-        pygame.draw.line(
-            pygame.display.get_surface(), 
-            "white", 
-            (p1.x * zoom + offset.x, p1.y * zoom + offset.y), 
-            (p2.x * zoom + offset.x, p2.y * zoom + offset.y), 
-            5
-        )
-
     def visualize(self, zoom: float, offset: pygame.Vector2) -> None:
         """
-        Draws a highlight on the edges of a Quadtree node.
+        Draws a highlight on the edges of every Quadtree node, read straight from the pool.
         Args:
             zoom (int or float): Your camera's zoom.
             offset (pygame.math.Vector2): Your camera's offset.
         """
-        args = (
-            pygame.display.get_surface(), # Surface to draw on
-            "white", # Color of highlight
-            pygame.FRect(self.boundary.left * zoom + offset.x, # Rect
-             self.boundary.top * zoom + offset.y,
-             self.boundary.width * zoom,
-             self.boundary.height * zoom),
-             3 # Highlight width
-        )
-        pygame.draw.rect(*args)
-        if not self.divided:
-            return
-        for node in self.children:
-            node.visualize(zoom, offset)
+        surface = pygame.display.get_surface()
+        pool = self.pool
+        nodes = [0]
+        while nodes:
+            node = nodes.pop()
+            rect = pygame.FRect(pool.left[node] * zoom + offset.x, pool.top[node] * zoom + offset.y,
+                                pool.width[node] * zoom, pool.height[node] * zoom)
+            pygame.draw.rect(surface, "white", rect, 3)
+            first = pool.first_child[node]
+            if first >= 0:
+                nodes.extend(range(first, first + 4))
 
 
 class SpatialGrid:
@@ -349,36 +379,38 @@ class SpatialGrid:
         """
         self.grid = {}
     
-    def draw_lines_to_neighbors(self, particle: "Particle", zoom: float, offset: pygame.Vector2) -> None:
+    def draw_lines_to_neighbors(self, x: float, y: float, store: "ParticleStore", zoom: float, offset: pygame.Vector2) -> None:
         """
         Draws lines from one particle's center to its neighbors' centers.
         Args:
-            p1 (Particle): Particle that you draw from to neighbors.
+            x, y (float): Position of the particle that you draw from to neighbors.
+            store (ParticleStore): Store the neighbor rows index into.
             zoom (float): Camera zoom.
             offset (pygame.math.Vector2): Camera offset.
         """
-        neighbors = self.get_neighbors(particle)
+        neighbors = self.get_neighbors(x, y)
         for n in neighbors:
             args = (
                 pygame.display.get_surface(),
                 "white",
-                (particle.x * zoom + offset.x, particle.y * zoom + offset.y),
-                (n.x * zoom + offset.x, n.y * zoom + offset.y),
+                (x * zoom + offset.x, y * zoom + offset.y),
+                (store.x[n] * zoom + offset.x, store.y[n] * zoom + offset.y),
                 5
             )
             pygame.draw.line(*args)
 
     # adds a particle to a cell. if cell does not exist, it creates a cell.
-    def add_particle(self, particle: "Particle") -> None:
+    def add_particle(self, index: int, x: float, y: float) -> None:
         """
         Add a particle to the appropriate cell in the grid.
         Args:
-            particle: Particle object with x and y attributes.
+            index (int): The particle's row in the ParticleStore.
+            x, y (float): The particle's position.
         """
-        cell = self.get_cell(particle.x, particle.y)
+        cell = self.get_cell(x, y)
         if cell not in self.grid:
             self.grid[cell] = []
-        self.grid[cell].append(particle)
+        self.grid[cell].append(index)
 
     def get_cell(self, x: float, y: float) -> tuple[int, int]:
         """
@@ -391,16 +423,16 @@ class SpatialGrid:
         """
         return int(x // self.cell_size), int(y // self.cell_size)
 
-    def get_neighbors(self, particle: "Particle") -> list["Particle"]:
+    def get_neighbors(self, x: float, y: float) -> list[int]:
         """
-        Get neighboring particles from adjacent cells, and particles in the same cell as particle.
+        Get neighboring particles from adjacent cells, and particles in the same cell as a position.
         Args:
-            particle: Particle object with x and y attributes.
+            x, y (float): The position to look around.
         Returns:
-            list: Neighboring particles + particles in same cell as particle.
+            list: Store rows of neighboring particles + particles in the same cell.
         """
         neighbors = []
-        cx, cy = self.get_cell(particle.x, particle.y)
+        cx, cy = self.get_cell(x, y)
         directions = [
             (cx - 1, cy - 1), (cx, cy - 1), (cx + 1, cy- 1),
             (cx - 1, cy),     (cx, cy),        (cx + 1, cy),
@@ -413,18 +445,20 @@ class SpatialGrid:
 
         return neighbors
     
-def find_particle(particles: list["Particle"], mouse_pos: tuple[float, float]) -> "Particle | None":
+def find_particle(store: "ParticleStore", mouse_pos: tuple[float, float]) -> "Particle | None":
     """
-    Find the first particle at the given mouse position.
+    Find the first particle whose bounding box contains the given mouse position.
     Args:
-        particles (iterable): Collection of particles.
-        mouse_pos (tuple): Mouse position.
+        store (ParticleStore): All particles.
+        mouse_pos (tuple): Mouse position in world coordinates.
     Returns:
-        Particle or None: The found particle or None.
+        Particle or None: The found particle's handle or None.
     """
-    for particle in particles:
-        if particle.rect.collidepoint(mouse_pos):    
-            return particle
+    hits = np.flatnonzero(
+        (np.abs(store.x - mouse_pos[0]) <= store.radius) & (np.abs(store.y - mouse_pos[1]) <= store.radius)
+    )
+    if hits.size:
+        return store.handles[hits[0]]
         
 def calculate_radius(mass: float, density: float) -> float:
     """
@@ -441,6 +475,19 @@ def calculate_radius(mass: float, density: float) -> float:
     radius = math.sqrt(area / math.pi)
     return max(MIN_RADIUS, min(radius, MAX_RADIUS))
 
+def calculate_radii(masses: np.ndarray, densities: np.ndarray) -> np.ndarray:
+    """
+    Vectorized calculate_radius() for whole arrays of particles.
+    Args:
+        masses (np.ndarray): Particle masses.
+        densities (np.ndarray): Particle densities.
+    Returns:
+        np.ndarray: Calculated radii.
+    """
+    epsilon = 1e-5
+    areas = masses / np.maximum(epsilon, densities)
+    return np.clip(np.sqrt(areas / math.pi), MIN_RADIUS, MAX_RADIUS)
+
 def split_string_every_n_chars(string: str, n: int) -> list[str]:
     """
     Split a string into chunks of n characters.
@@ -532,7 +579,7 @@ class Accelerator:
     
 _cached_color_bins = None
 
-def calculate_color_bins(particles: pygame.sprite.Group, frame_count: int) -> np.ndarray:
+def calculate_color_bins(masses: np.ndarray, frame_count: int) -> np.ndarray:
     global _cached_color_bins
 
     skip_frames = 10 # [int] frames are skipped for calculations
@@ -540,10 +587,9 @@ def calculate_color_bins(particles: pygame.sprite.Group, frame_count: int) -> np
         if _cached_color_bins is not None:
             return _cached_color_bins
         
-    if len(particles) < 1:
+    if len(masses) < 1:
         return
     
-    masses = np.array([p.mass for p in particles])
     percentiles = np.percentile(masses, np.linspace(0, 100, 11))  # 10 intervals
     _cached_color_bins = percentiles
 
@@ -564,7 +610,232 @@ def split_particles_not_in_render(particles: Sequence["Particle"], n_particles_r
 
     return particles
     
-def update_particles(particles: Sequence["Particle"], dt: float, cam: "Cam", percentiles: np.ndarray, grid: SpatialGrid, quadtree: QuadTree, counter) -> None:
-    for particle in particles:
-        particle.update(dt, cam, percentiles, grid, quadtree, counter)
+def apply_forces(pseudo_particles: np.ndarray, x: float, y: float) -> tuple[float, float]:
+    """
+    Sums the gravitational acceleration that pseudo-particles exert on a point.
+    Args:
+        pseudo_particles (np.ndarray): vectorized array of pseudo particles represented as (x, y, mass) tuples
+        x, y (float): The position of the particle the forces act on.
+    Returns:
+        tuple[float, float]: The (ax, ay) acceleration.
+    """
+    if len(pseudo_particles) == 0:
+        return 0.0, 0.0
+    ppx, ppy, ppm = pseudo_particles[:, 0], pseudo_particles[:, 1], pseudo_particles[:, 2]
+    dx = ppx - x
+    dy = ppy - y
+    d2 = dx*dx + dy*dy + GRAVITY_SOFTENING
+
+    ax = np.sum(G * ppm * dx / (d2**1.5))
+    ay = np.sum(G * ppm * dy / (d2**1.5))
+    return ax, ay
+
+batched_forces = BarnesHutForces()
+direct_forces = DirectForces()
+
+def calculate_accelerations(store: "ParticleStore", indices: np.ndarray, quadtree: "QuadTree | LinearQuadTree",
+                            forces: BarnesHutForces | ParallelForces | FMMForces | ParticleMeshForces | DirectForces | None = None) -> np.ndarray:
+    """
+    Calculates the gravitational acceleration of the given particles.
+    Args:
+        store (ParticleStore): All particles.
+        indices (np.ndarray): Rows to calculate the accelerations of.
+        quadtree (QuadTree | LinearQuadTree): A built quadtree.
+        forces (BarnesHutForces | ParallelForces | FMMForces | ParticleMeshForces | DirectForces | None): Batched force evaluator,
+            used with a LinearQuadTree. A shared serial barnes-hut one if None. The per-particle query_bh() path takes the
+            barnes-hut evaluator's theta but always opens nodes by the geometric criterion.
+            A LinearQuadTree of fewer than DIRECT_SUM_BELOW particles is summed directly whatever the evaluator.
+    Returns:
+        np.ndarray: (len(indices), 2) accelerations.
+    """
+    x, y = store.x[indices], store.y[indices]
+    if isinstance(quadtree, LinearQuadTree) and len(quadtree.x) < DIRECT_SUM_BELOW and not isinstance(forces, DirectForces):
+        forces = direct_forces
+    if isinstance(forces, (FMMForces, ParticleMeshForces, DirectForces)) and isinstance(quadtree, LinearQuadTree):
+        return forces.accelerations(quadtree, x, y)
+    barnes_hut = forces if isinstance(forces, (BarnesHutForces, ParallelForces)) else batched_forces
+    if BATCHED_FORCES and isinstance(quadtree, LinearQuadTree):
+        return barnes_hut.accelerations(quadtree, x, y, store.acc[indices]) # the last accelerations, for the "relative" criterion
+    acc = np.zeros((len(indices), 2))
+    theta2 = barnes_hut.theta**2
+    for k, (px, py) in enumerate(zip(x.tolist(), y.tolist())):
+        pseudo_particles = quadtree.query_bh(px, py, theta2=theta2)
+        acc[k] = apply_forces(pseudo_particles, px, py)
+    return acc
+
+def collide_particles(store: "ParticleStore", indices: np.ndarray, grid: SpatialGrid) -> None:
+    """
+    Merges every particle with the neighbors it overlaps. Merged-away particles are only marked dead.
+    Args:
+        store (ParticleStore): All particles.
+        indices (np.ndarray): Rows to check for collisions.
+        grid (SpatialGrid): Grid the rows were added to.
+    """
+    pos, radius, flags = store.pos, store.radius, store.flags
+    for i in indices.tolist():
+        if flags[i] & DEAD:
+            continue
+        x, y = pos[i]
+        for j in grid.get_neighbors(x, y):
+            if j == i or flags[j] & (DEAD | DRAGGED):
+                continue
+            dx = pos[j, 0] - pos[i, 0]
+            dy = pos[j, 1] - pos[i, 1]
+            d2 = dx**2 + dy**2
+            R2 = (radius[j] + radius[i])**2
+            if R2 >= d2: # r2d2 yoooo
+                if store.merge(i, j) != i:
+                    break
+
+def build_quadtree(quadtree: "QuadTree | LinearQuadTree", store: "ParticleStore", indices: np.ndarray) -> None:
+    """
+    Rebuilds the quadtree from the given particles and calculates every node's center of mass.
+    With QUADTREE_INCREMENTAL, a QuadTree is refit() in place instead of cleared and refilled.
+    Args:
+        quadtree (QuadTree | LinearQuadTree): The tree to rebuild.
+        store (ParticleStore): All particles.
+        indices (np.ndarray): Rows to put in the tree.
+    """
+    if isinstance(quadtree, LinearQuadTree):
+        quadtree.build(indices, store.x[indices], store.y[indices], store.mass[indices])
+        return
+    if QUADTREE_INCREMENTAL:
+        quadtree.refit(indices.tolist(), store.ids[indices].tolist(), store.x[indices].tolist(), store.y[indices].tolist())
+        quadtree.calculate_CoM(store.mass)
+        return
+    quadtree.clear()
+    for i, x, y in zip(indices.tolist(), store.x[indices].tolist(), store.y[indices].tolist()):
+        quadtree.insert(i, x, y)
+    quadtree.calculate_CoM(store.mass)
+
+def update_particles(store: "ParticleStore", indices: np.ndarray, dt: float, grid: SpatialGrid, quadtree: "QuadTree | LinearQuadTree", counter,
+                     profiler: FrameProfiler | None = None, forces: BarnesHutForces | ParallelForces | FMMForces | ParticleMeshForces | DirectForces | None = None,
+                     integrator: Leapfrog | None = None) -> None:
+    """
+    Advances the given particles by one step over whole arrays: the integrator's drifts, kicks and wall bounces,
+    then merges. The quadtree is rebuilt from the drifted positions before every force evaluation.
+    Dead particles are compacted out of the store at the end, so row indices are invalid afterwards.
+    Args:
+        store (ParticleStore): All particles.
+        indices (np.ndarray): Rows to update. They must already be in the grid.
+        dt (float): Delta time since last frame.
+        grid (SpatialGrid): Grid used for collisions when BATCHED_COLLISIONS is off.
+        quadtree (QuadTree | LinearQuadTree): Quadtree used for barnes-hut forces.
+        profiler (FrameProfiler | None): Times the integration, tree, force and collision stages if given.
+        forces (BarnesHutForces | ParallelForces | FMMForces | ParticleMeshForces | DirectForces | None): Batched force evaluator.
+        integrator (Leapfrog | None): Integration scheme. Kick-drift-kick leapfrog if None.
+    """
+    section = profiler.section if profiler else lambda name: nullcontext()
+
+    def accelerations() -> np.ndarray:
+        with section("tree"):
+            build_quadtree(quadtree, store, indices)
+        with section("forces"):
+            return calculate_accelerations(store, indices, quadtree, forces)
+
+    with section("integrate"):
+        store.prev_pos[indices] = store.pos[indices]
+    (integrator or default_integrator).step(store, indices, dt, accelerations, section)
+
+    with section("collisions"):
+        if BATCHED_COLLISIONS:
+            merge_collisions(store, indices)
+        else:
+            collide_particles(store, indices, grid)
+    with section("integrate"):
+        store.compact()
 
+default_integrator = Leapfrog()
+
+def timestep_levels(store: "ParticleStore", indices: np.ndarray, dt: float,
+                    max_level: int = BLOCK_MAX_LEVEL, eta: float = BLOCK_ETA) -> np.ndarray:
+    """
+    Picks the block level of every particle: level k steps it by dt / 2**k.
+    A particle's own timestep is the shorter of the time its acceleration takes to change its velocity by `eta` of
+    itself and the time it takes to move it `eta` of its radius from rest, so particles in strong fields, the close
+    encounters, get short steps. A particle at rest only uses the second.
+    Args:
+        store (ParticleStore): All particles, with the accelerations of the last step.
+        indices (np.ndarray): Rows to pick levels for.
+        dt (float): The shared step, level 0.
+        max_level (int): Deepest level.
+        eta (float): Accuracy parameter.
+    Returns:
+        np.ndarray: int64 level of every row in indices.
+    """
+    a = np.hypot(store.acc[indices, 0], store.acc[indices, 1])
+    v = np.hypot(store.vel[indices, 0], store.vel[indices, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        own_dt = np.minimum(np.where(v > 0, eta * v / a, np.inf), np.sqrt(2 * eta * store.radius[indices] / a))
+        levels = np.ceil(np.log2(dt / own_dt))
+    return np.clip(np.nan_to_num(levels, nan=0.0), 0, max_level).astype(np.int64)
+
+def update_particles_blocks(store: "ParticleStore", indices: np.ndarray, dt: float, grid: SpatialGrid, quadtree: "QuadTree | LinearQuadTree", counter,
+                            profiler: FrameProfiler | None = None, forces: BarnesHutForces | ParallelForces | FMMForces | ParticleMeshForces | DirectForces | None = None) -> dict:
+    """
+    update_particles() with hierarchical block timesteps. The step is split into 2**depth substeps, depth being the
+    deepest level in use, and a particle on level k kicks every 2**(depth - k) of them (kick-drift-kick leapfrog,
+    whatever the integrator setting).
+    Every particle drifts on every substep, but forces are only evaluated for the particles whose step ends there, so
+    particles that don't need small steps cost one force evaluation per step as before. The quadtree is only built for
+    substeps with at least BLOCK_DIRECT_BELOW such particles and for the last one; fewer are summed directly over every
+    particle, which is cheaper than a build.
+    With every particle on level 0 it is the same velocity Verlet step as update_particles(). Merges still happen
+    once per step.
+    Args:
+        store (ParticleStore): All particles.
+        indices (np.ndarray): Rows to update.
+        dt (float): Delta time since last frame.
+        grid (SpatialGrid): Grid used for collisions when BATCHED_COLLISIONS is off.
+        quadtree (QuadTree | LinearQuadTree): Quadtree used for barnes-hut forces. It is rebuilt on the substeps that use it.
+        profiler (FrameProfiler | None): Times the integration, tree, force and collision stages if given.
+        forces (BarnesHutForces | ParallelForces | FMMForces | ParticleMeshForces | DirectForces | None): Batched force evaluator.
+    Returns:
+        dict: Stats of the step: particles per level, substeps, tree builds, force evaluations done, and the
+            evaluations a shared step of the smallest size would have done.
+    """
+    section = profiler.section if profiler else lambda name: nullcontext()
+    pos, vel, acc = store.pos, store.vel, store.acc
+    with section("integrate"):
+        store.prev_pos[indices] = pos[indices]
+        levels = timestep_levels(store, indices, dt)
+        depth = int(levels.max()) if len(levels) else 0
+        substeps = 1 << depth
+        h = dt / substeps
+        stride = 1 << (depth - levels) # substeps per particle step
+        half_kick = (0.5 * h * stride)[:, np.newaxis]
+
+    evaluations = builds = 0
+    for s in range(substeps):
+        with section("integrate"):
+            starting = s % stride == 0
+            vel[indices[starting]] += acc[indices[starting]] * half_kick[starting]
+            pos[indices] += vel[indices] * h
+            window_collisions(store, indices)
+            ending = (s + 1) % stride == 0
+            rows = indices[ending]
+        if not len(rows):
+            continue
+        if len(rows) < BLOCK_DIRECT_BELOW and s < substeps - 1: # the last substep leaves the tree built for the frame
+            with section("forces"):
+                acc[rows] = direct_forces.source_accelerations(store.x[indices], store.y[indices], store.mass[indices],
+                                                               store.x[rows], store.y[rows])
+        else:
+            with section("tree"):
+                build_quadtree(quadtree, store, indices)
+            with section("forces"):
+                acc[rows] = calculate_accelerations(store, rows, quadtree, forces)
+            builds += 1
+        with section("integrate"):
+            vel[rows] += acc[rows] * half_kick[ending]
+        evaluations += len(rows)
+
+    with section("collisions"):
+        if BATCHED_COLLISIONS:
+            merge_collisions(store, indices)
+        else:
+            collide_particles(store, indices, grid)
+    with section("integrate"):
+        store.compact()
+    return {"levels": np.bincount(levels, minlength=BLOCK_MAX_LEVEL + 1), "substeps": substeps, "builds": builds,
+            "evaluations": evaluations, "shared_evaluations": len(indices) * substeps}